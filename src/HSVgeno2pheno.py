@@ -39,8 +39,8 @@ def parse_arguments():
 	ap = argparse.ArgumentParser(add_help=False)
 	ap.add_argument(
 		"tool", nargs="?", default="",
-		help="Choose from 'sequences', 'phenos', 'mutation', 'molis', 'modify' "
-		     "and 'suppress'"
+		help="Choose from 'sequences', 'phenos', 'merge', 'mutation', 'molis', "
+		     "'modify' and 'suppress'"
 	)
 	ap.add_argument(
 		"-h", "--help", action="store_true",
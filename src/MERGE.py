@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Module for merging sharded imports.
+
+SEQUENCES and PHENOS --shard i/N each import a share of the input files into
+DynamicTables of their own, under data/shards/{i}of{N}, so that a re-analysis
+can be spread over the nodes of a cluster with nothing but the shared
+filesystem in common. Once the shards are complete, their FILES, FASTAS and
+VARIANTS (and PHENOS and EC50S, and MOLIS) are appended to the main Tables,
+each PARENT_ID re-mapped to the index of its parent in the main Table, and
+their MANIFESTs recorded. Files already in the main Tables (i.e. re-analysed)
+have their previous sequences, variants and EC50s replaced. Each shard is
+merged in a single transaction (SQL-backed Tables), then renamed
+{i}of{N}.<time>.merged so that it is never merged twice.
+"""
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from datetime import datetime as dt
+from glob import glob
+
+from utils import g2pU, gU
+from data_init.g2pTables import *
+
+# Parent -> child chains of the DynamicTables written by a shard
+chains = ((fil, fas, var), (phe, ec50), (mol, ))
+
+################################################################################
+def parse_arguments():
+	"""
+	Parse command-line arguments.
+	"""
+
+	ap = argparse.ArgumentParser(prog="HSVgeno2pheno.py merge")
+
+	ap.add_argument(
+		"shards", nargs="*",
+		help="Shard directories to merge [all unmerged shards in data/shards]"
+	)
+	ap.add_argument(
+		"--force", action="store_true",
+		help="Merge shards even if their last import run is unfinished"
+	)
+	ap.add_argument(
+		"--keep", action="store_true",
+		help="Leave merged shards as they are, rather than renaming them *.merged"
+	)
+
+	return ap.parse_args()
+
+################################################################################
+def unfinished(root):
+	"Returns the input files left unfinished by the last import run of <root>"
+
+	try: return g2pU.ImportRun.resume(location=f"{root}/dynamic/runs").unfinished()
+	except FileNotFoundError: return []
+
+#-------------------------------------------------------------------------------
+def merge_shard(root):
+	"Folds the DynamicTables of shard <root> into the main Tables"
+
+	for chain in chains:
+		mapping = None
+		for table in chain:
+			df = table.at(root).df
+			if mapping is not None:
+				df = df[df.PARENT_ID.isin(mapping.index)]
+				df = df.assign(PARENT_ID=df.PARENT_ID.map(mapping))
+			if df.empty: break
+
+			index, merged = table.append(df)
+			table.write()
+			log.info(f"{len(df)} {table.name} row(s) merged, {len(index)} new")
+
+			# Re-analysed files replace their earlier children
+			if mapping is None and len(old := merged.index.difference(index)):
+				if (child := table.child) is not None and not child.df.empty:
+					child.delete(child.filter(("PARENT_ID", old), index=True))
+
+			mapping = pd.Series(merged.index, index=df.index)
+
+	g2pU.record_manifest(man.at(root).df)
+
+################################################################################
+def main(args):
+
+	global log
+
+	log = g2pU.getLog("merge")
+	g2pU.log = gU.log = log
+
+	shards = args.shards or sorted(glob(f"{g2pU.shard_dir}/*of*[0-9]"))
+	if not shards: return log.info("No shards to merge")
+
+	for root in map(os.path.abspath, shards):
+		if (files := unfinished(root)) and not args.force:
+			log.warning(f"Skipping {root} - {len(files)} file(s) unfinished")
+			continue
+
+		log.info(f"*-- Merging {root} --*")
+		with transaction():
+			merge_shard(root)
+		if not args.keep:
+			os.rename(root, f"{root}.{dt.now().strftime('%Y%m%d_%H%M%S')}.merged")
+
+################################################################################
+if __name__ == "__main__":
+
+	sys.exit(main(parse_arguments()))
+
+################################################################################
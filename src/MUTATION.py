@@ -82,7 +82,7 @@ def report_mut():
 		ec50 = g2pU.phe.filter(("MOLIS", molis)).merge(
 			g2pU.ec50.df, left_index=True, right_on="PARENT_ID", how="inner"
 		)
-		for drug, df in ec50.groupby("DRUG"):
+		for drug, df in ec50.groupby("DRUG", observed=True):
 			df["OTHER_MUTS"] = df.MOLIS.apply(partial(func, drug=drug))
 			df = rP.evaluate_ec50s(df)
 			df = df[df.VALID=="pass"]
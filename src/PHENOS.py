@@ -41,8 +41,22 @@ def parse_arguments():
 		"--recursive", action="store_true",
 		help="Set to look in all subdirectories of <directory>"
 	)
+	ap.add_argument(
+		"--watch", nargs="?", const=60, type=int, metavar="SECONDS",
+		help="Keep importing new PRAs from <directory>, every SECONDS [60]"
+	)
+	ap.add_argument(
+		"--shard", type=g2pU.parse_shard, metavar="i/N",
+		help="Import only shard i of N of the PRAs, into data/shards (see MERGE)"
+	)
+	ap.add_argument(
+		"--procs", default=g2pU.analysis_procs, type=int,
+		help=f"Number of worker processes for PRA parsing (0 - threads) [{g2pU.analysis_procs}]"
+	)
 
 	args = ap.parse_args()
+	g2pU.procs = args.procs
+	if args.shard: g2pU.set_shard(args.shard)
 
 	return args
 
@@ -53,11 +67,16 @@ def find_PRA_files():
 
 	PRAs = g2pU.find_input_files(args, r"^[\w\.-]+\.xlsx?$")
 
-	df = pd.DataFrame(map(parse_input_file, PRAs), columns=phe.cols)
+	# Only new or changed files are parsed (see g2pU.filter_manifest)
+	manifest = g2pU.filter_manifest(PRAs, force=args.force)
+	log.info(f"{len(manifest)} of {len(PRAs)} PRA(s) new or changed")
+	g2pU.remove_changed(phe, manifest)
+
+	df = pd.DataFrame(map(parse_input_file, manifest.PATH), columns=phe.cols)
 	df = phe.append(df)[1]
 	phe.write()
 
-	return df
+	return df, manifest
 
 #-------------------------------------------------------------------------------
 def parse_input_file(PRA):
@@ -91,9 +110,19 @@ def main(args):
 	g2pU.log = gU.log = log
 
 	if args.statistics: return pU.statistics()
+	if args.watch: return g2pU.watch(import_PRAs, args.watch)
 
-	df = find_PRA_files()
-	g2pU.analyse_data(df, ec50, pU.parse_PRA, "PRA")
+	return import_PRAs()
+
+#-------------------------------------------------------------------------------
+def import_PRAs():
+	"Imports the new or changed PRA(s)"
+
+	# A single transaction per import (SQL-backed Tables only)
+	with transaction():
+		df, manifest = find_PRA_files()
+		g2pU.analyse_data(df, ec50, pU.parse_PRA, "PRA")
+		g2pU.record_manifest(manifest)
 
 ################################################################################
 if __name__ == "__main__":
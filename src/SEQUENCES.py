@@ -19,6 +19,7 @@ import numpy as np
 import pandas as  pd
 
 from datetime import datetime as dt
+from functools import partial
 from glob import glob
 
 from utils import g2pU, gU, sU
@@ -45,6 +46,23 @@ def parse_arguments():
 		"-s", "--statistics", action="store_true",
 		help="Give description of databases (overrides other options)"
 	)
+	ap.add_argument(
+		"--benchmark", action="store_true",
+		help="Time the mapping engines on stored sequences (overrides other options)"
+	)
+	ap.add_argument(
+		"--verify", action="store_true",
+		help="Re-call stored sequences and compare with stored variants (overrides other options)"
+	)
+
+	ap.add_argument(
+		"--ngs", action="store_true",
+		help="Import QuasiBAM base frequency tables (NGS) rather than FASTAs"
+	)
+	ap.add_argument(
+		"--min_freq", default=g2pU.ngs_min_freq, type=float,
+		help=f"Minimum frequency (%%) of the bases called from NGS tables [{g2pU.ngs_min_freq}]"
+	)
 
 	ap.add_argument(
 		"--report_format", default=0, type=int,
@@ -73,31 +91,121 @@ def parse_arguments():
 		"--force", action="store_true",
 		help="Force overwrite of existing records with identical data"
 	)
+	ap.add_argument(
+		"--resume", nargs="?", const="latest", metavar="RUN",
+		help="Resume import run RUN (see data/dynamic/runs) [latest]"
+	)
+	ap.add_argument(
+		"--watch", nargs="?", const=60, type=int, metavar="SECONDS",
+		help="Keep importing new FASTAs from <directory>, every SECONDS [60]"
+	)
+	ap.add_argument(
+		"--shard", type=g2pU.parse_shard, metavar="i/N",
+		help="Import only shard i of N of the FASTAs, into data/shards (see MERGE)"
+	)
+	ap.add_argument(
+		"--aligner", default="auto", choices=("auto", "bwa", "numpy"),
+		help="Read mapping engine - auto picks BWA if installed (see aU) [auto]"
+	)
+	ap.add_argument(
+		"--threads", default=g2pU.bwa_threads, type=int,
+		help=f"Number of threads for read mapping [{g2pU.bwa_threads}]"
+	)
+	ap.add_argument(
+		"--batch", default=g2pU.batch_records, type=int,
+		help=f"Number of FASTA records imported (and committed) at a time [{g2pU.batch_records}]"
+	)
+	ap.add_argument(
+		"--no_cache", action="store_true",
+		help="Call variants afresh, rather than from the variant call cache"
+	)
+	ap.add_argument(
+		"--procs", default=g2pU.analysis_procs, type=int,
+		help=f"Number of worker processes for variant calling (0 - threads) [{g2pU.analysis_procs}]"
+	)
 
 	args = ap.parse_args()
 
-	if not (args.statistics or args.import_data or args.report_data):
+	if not any((args.statistics, args.benchmark, args.verify, args.import_data,
+				args.resume, args.report_data)):
 		ap.print_help()
 		log.info("At least one of -i, -rm or -s must be passed")
 		return 65
 
+	args.import_data |= bool(args.resume)
 	rP.format_code = args.report_data
+	sU.aligner, sU.threads = args.aligner, args.threads
+	g2pU.procs = args.procs
+	if args.no_cache: g2pU.g2pC.cache.size = 0
+	if args.shard: g2pU.set_shard(args.shard)
 
 	return args
 
 ################################################################################
-def find_FASTA_files():
+def find_FASTA_files(import_run=None):
+	"""
+	Returns the FASTA file(s) found - or QuasiBAM tables if <args.ngs> - or if
+	resuming, those left unfinished by <import_run>, with their MANIFEST rows.
+	Imports only take new or changed files (see g2pU.filter_manifest), the
+	data of changed files being removed.
+	"""
 
-	log.info("*-- Getting FASTA file(s) --*")
+	if args.resume:
+		FASTAs = import_run.unfinished()
+		log.info(f"*-- Resuming {len(FASTAs)} unfinished file(s) --*")
 
-	FASTAs = g2pU.find_input_files(args, r"^[\w\.-]+\.fas?(?:ta)?$")
-	index = []
-	df = pd.DataFrame(map(parse_input_file, FASTAs), columns=fil.cols)
-	if not df.empty:
-		index, df = fil.append(df)
-		fil.write()
+	else:
+		if args.ngs:
+			log.info("*-- Getting QuasiBAM file(s) --*")
+			regex = r"^[\w\.-]+\.(?:tsv|txt)$"
+		else:
+			log.info("*-- Getting FASTA file(s) --*")
+			regex = r"^[\w\.-]+\.fas?(?:ta)?$"
+
+		FASTAs = g2pU.find_input_files(args, regex)
+
+	manifest = None
+	if args.import_data:
+		manifest = g2pU.filter_manifest(FASTAs, force=args.force)
+		log.info(f"{len(manifest)} of {len(FASTAs)} file(s) new or changed")
+		FASTAs = [*manifest.PATH]
+		with transaction(): g2pU.remove_changed(fil, manifest)
 
-	return index, df
+	if import_run and not args.resume:
+		import_run.log(FASTAs, "FOUND")
+		import_run.commit()
+
+	return FASTAs, manifest
+
+#-------------------------------------------------------------------------------
+def iter_record_batches(FASTAs):
+	"""
+	Yields the records of <FASTAs> (PATH, NAME and SEQ) in batches of up to
+	<args.batch>, each with the paths of the files it completes. Files are read
+	a record at a time (see sU.iter_FASTA), so that a large multi-FASTA spans
+	as many batches as it needs. Each QuasiBAM table is a single record (see
+	sU.iter_NGS).
+	"""
+
+	read = sU.iter_NGS if args.ngs else sU.iter_FASTA
+	cols = ["PATH", "NAME", "SEQ"]
+
+	# Each file ends with a (PATH, None, None) record, marking it complete
+	records = it.chain.from_iterable(
+		it.chain(((path, *record) for record in read(path)), [(path, None, None)])
+		for path in FASTAs
+	)
+
+	batch, done = [], []
+	for path, name, seq in records:
+		if name is None: done.append(path)
+		else: batch.append((path, name, seq))
+
+		if len(batch) == args.batch:
+			yield pd.DataFrame(batch, columns=cols), done
+			batch, done = [], []
+
+	if batch or done: yield pd.DataFrame(batch, columns=cols), done
 
 #-------------------------------------------------------------------------------
 def parse_input_file(fas):
@@ -153,6 +261,22 @@ def data_import(df, table):
 	log.info(f"Importing any new data into {gU.filestem(table.fname)}")
 	return table.append(df, write=False)
 
+################################################################################
+def verify():
+	"Re-calls the stored sequences, logging any that differ from VARIANTS"
+
+	# NGS samples have no sequence (see sU.import_NGS)
+	if (seq_df := g2pU.g2pC.with_seq(fas.df)).empty:
+		log.warning("No stored sequences to verify")
+		return 67
+
+	log.info(f"*-- Verifying the variants of {len(seq_df)} sequences --*")
+	if (df := sU.verify(seq_df, var.df)).empty:
+		return log.info("All variants match")
+
+	log.info(f"{len(df)} sequences differ\n{df}")
+	return 1
+
 ################################################################################
 def main(args):
 
@@ -162,22 +286,93 @@ def main(args):
 	g2pU.log = gU.log = rP.log = log
 
 	if args.statistics: return sU.statistics()
+	if args.benchmark: return log.info(f"Mapping times (s)\n{sU.benchmark(fas.df)}")
+	if args.verify: return verify()
+	if args.watch: return g2pU.watch(partial(run, args), args.watch)
+
+	return run(args)
+
+#-------------------------------------------------------------------------------
+def run(args):
+	"""
+	Imports and/or reports the FASTA(s), as a pipeline of bounded batches of
+	records (see <args.batch>) - each parsed, mapped, called, appended and
+	committed before the next is read, so that memory use does not grow with
+	the size of the import. The FASTA(s) are reported once all are imported.
+	"""
 
-	index, fil_df = find_FASTA_files()
-	fas_df = g2pU.analyse_data(fil_df, fas, sU.parse_FASTA, "FASTA")
-	print(fas_df)
-	input()
+	import_run = None
+	if args.import_data:
+		import_run = g2pU.ImportRun.resume(args.resume) if args.resume \
+					 else g2pU.ImportRun()
+		log.info(f"*-- Import run {import_run.name} --*")
 
-	var_df = g2pU.analyse_data(fas_df, var, sU.parse_variants, "SEQ")
-	print(var_df)
-	input()
+	FASTAs, manifest = find_FASTA_files(import_run)
+	new, fil_dfs = [], []
 
-	if not args.import_data: fil.delete(index)	# Remove "new" data
-	if not args.report_data: return
+	try:
+		for records, done in iter_record_batches(FASTAs):
+			index, fil_df = import_batch(records, done, manifest, import_run)
+			new.extend(index)
+			fil_dfs.append(fil_df)
+
+		if args.report_data and fil_dfs:
+			fil_df = pd.concat(fil_dfs)
+			report(fil_df[~fil_df.index.duplicated()])
+
+	finally:
+		if not args.import_data and new: fil.delete(new)	# Remove "new" data
+
+#-------------------------------------------------------------------------------
+def import_batch(records, done, manifest=None, import_run=None):
+	"""
+	Imports a batch of <records> (see <iter_record_batches>), completing the
+	files <done>. Returns the indexes of the new FILES, and the FILES entries
+	of the batch. Each stage completed is logged to <import_run>, and the
+	<manifest> rows of the files <done> recorded.
+	"""
+
+	def log_stage(paths, stage):
+		if import_run: import_run.log(paths, stage)
+
+	paths = [*dict.fromkeys((*records.PATH, *done))]
+
+	# A single transaction per batch (SQL-backed Tables only)
+	with transaction():
+		index, fil_df = fil.append(pd.DataFrame(map(parse_input_file, paths), columns=fil.cols))
+		fil.write()
+		log_stage(paths, "FILES")
+
+		records["PARENT_ID"] = records.PATH.map(dict(zip(paths, fil_df.index)))
+		fas_df = fas.append(sU.parse_FASTA(records.drop(columns="PATH")))[1]
+		fas.write()
+		log_stage(done, "FASTAS")
+
+		# NGS samples are called from their QuasiBAM tables, not mapped
+		if args.ngs:
+			sU.import_NGS(
+				fas_df.assign(PATH=fas_df.PARENT_ID.map(dict(zip(fil_df.index, paths)))),
+				args.min_freq
+			)
+		else:
+			g2pU.analyse_data(fas_df, var, sU.parse_variants, "SEQ", init=sU.init_worker)
+		log_stage(done, "VARIANTS")
+
+		if manifest is not None: g2pU.record_manifest(manifest[manifest.PATH.isin(done)])
+
+	if import_run: import_run.commit()
+	return index, fil_df
+
+#-------------------------------------------------------------------------------
+def report(fil_df):
+	"Reports the FASTA(s) of <fil_df>"
 
 	log.debug(f"REPORT format: {args.report_data}")
 	log.info("*-- Merging FASTA and VARIANT data for reporting --*")
 
+	fas_df = fas.filter(("PARENT_ID", fil_df.index))
+	var_df = var.filter(("PARENT_ID", fas_df.index))
+
 	df = pd.merge(
 		fil_df.drop("LOCATION", axis=1), fas_df.reset_index(),
 		how="outer", left_index=True, right_on="PARENT_ID"
@@ -0,0 +1,201 @@
+"""
+Content-addressed cache of variant calls.
+
+The variants called in a sequence (its HGVS list, as per sU.parse_variants)
+depend only on the sequence, on the mapping engine (see sU.choose_engine), and
+on the references and code that map and call it. Calls are therefore cached
+against the SHA-1 of the engine and the cleaned sequence, and the version of
+the bundle (a hash of ref_seqs.fas, the BWA index and the calling code - see
+<bundle_version>), so that sequences seen before (a re-run of the same MOLIS,
+or a FASTA re-imported with --force) skip mapping and variant calling. The
+cache is a SQLite Database of its own, bounded to <variant_cache_size> entries
+by evicting the least recently used, and emptied of any entries called against
+another bundle when first opened.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+from .g2pConstants import *
+from .g2pStorage import Database
+
+# The files that the cached calls depend on - the references, their BWA index,
+# and the modules that map sequences and call variants
+bundle_files = [
+	f"{data_dir}/static/ref_seqs.fas",
+	*(f"{data_dir}/static/bwa.{ext}" for ext in ("amb", "ann", "bwt", "pac", "sa")),
+	*(f"{src}/utils/{name}.py" for name in (
+		"generalUtilities", "g2pUtilities", "sequencesUtilities", "alignUtilities",
+		"codonUtilities", "refUtilities"
+	))
+]
+
+################################################################################
+class VariantCache(object):
+	"""
+	The cache of variant calls (HGVS lists) by sequence and mapping engine.
+	<lookup> splits a DataFrame of sequences (<SEQ>) into the cached variants
+	(as VARIANTS rows) and the sequences still to be called, and <store> caches
+	the calls made for the latter. Lookups are only marked as used (for
+	eviction) by <flush>. <size> entries are kept (0 disables the cache).
+	"""
+
+	name = "CALLS"
+	cols = ["KEY", "BUNDLE", "HGVS", "USED"]
+
+	def __init__(self, fname, size=variant_cache_size):
+		self.fname = fname
+		self.size = size
+		self.database = Database(fname)
+		self.bundle = None
+		self.touched = {}
+		self.lock = threading.Lock()
+
+	def __repr__(self):
+		return f"VariantCache({self.fname}, {self.size})"
+
+	def open(self):
+		"Creates the cache, or drops entries of other reference bundles, once"
+
+		with self.lock:
+			if self.bundle is not None: return
+
+			self.database.create(
+				self.name, self.cols, types={"USED": "REAL"}, indexed=["USED"],
+				unique=["KEY"]
+			)
+			self.bundle = bundle_version()
+			with self.database.transaction() as conn:
+				conn.execute(f'DELETE FROM "{self.name}" WHERE BUNDLE != ?', (self.bundle, ))
+
+	def transaction(self):
+		"A (write) transaction on the cache - see <Database.transaction>"
+
+		self.open()
+		return self.database.transaction()
+
+	def lookup(self, df, engine):
+		"""
+		Returns the VARIANTS rows (HGVS and PARENT_ID) of the sequences of <df>
+		that are cached (as mapped by <engine>), and the sub-DataFrame of those
+		that are not
+		"""
+
+		empty = pd.DataFrame(columns=["HGVS", "PARENT_ID"])
+		if not self.size or df.empty: return empty, df
+
+		self.open()
+		keys = with_seq(df).SEQ.map(lambda seq: sequence_key(seq, engine))
+		hits = {}
+		for i in range(0, len(keys), 500):
+			batch = [*set(keys.iloc[i:i + 500])]
+			hits.update(self.database.conn.execute(
+				f'SELECT KEY, HGVS FROM "{self.name}" '
+				f'WHERE KEY IN ({", ".join("?" * len(batch))})', batch
+			).fetchall())
+
+		if not hits: return empty, df
+		with self.lock:
+			self.touched.update(dict.fromkeys(hits, time.time()))
+
+		cached = keys[keys.isin(hits)]
+		rows = [
+			(hgvs, index)
+			for index, key in cached.items()
+			for hgvs in json.loads(hits[key])
+		]
+
+		return pd.DataFrame(rows, columns=empty.columns), df.drop(cached.index)
+
+	def store(self, df, var_df, engine):
+		"""
+		Caches the variants of <var_df> (VARIANTS rows) for each sequence of
+		<df> (as mapped by <engine>), including those without any (i.e. that
+		did not map)
+		"""
+
+		if not self.size or (df := with_seq(df)).empty: return
+
+		calls = var_df.groupby("PARENT_ID").HGVS.agg(list)
+		now = time.time()
+		rows = {
+			sequence_key(seq, engine): json.dumps(calls.get(index, []))
+			for index, seq in zip(df.index, df.SEQ)
+		}
+
+		with self.transaction() as conn:
+			conn.executemany(
+				f'INSERT OR REPLACE INTO "{self.name}" (KEY, BUNDLE, HGVS, USED) '
+				f'VALUES (?, ?, ?, ?)',
+				[(key, self.bundle, hgvs, now) for key, hgvs in rows.items()]
+			)
+			self.evict(conn)
+
+	def flush(self):
+		"Marks the entries looked up since the last flush as used, at once"
+
+		with self.lock:
+			touched, self.touched = self.touched, {}
+		if not touched: return
+
+		with self.transaction() as conn:
+			conn.executemany(
+				f'UPDATE "{self.name}" SET USED = ? WHERE KEY = ?',
+				[(used, key) for key, used in touched.items()]
+			)
+
+	def evict(self, conn):
+		"Deletes the least recently used entries, if there are over <size>"
+
+		count, = conn.execute(f'SELECT count(*) FROM "{self.name}"').fetchone()
+		if count <= self.size: return
+
+		conn.execute(
+			f'DELETE FROM "{self.name}" WHERE idx IN '
+			f'(SELECT idx FROM "{self.name}" ORDER BY USED LIMIT ?)', (count - self.size, )
+		)
+
+	def clear(self):
+		"Empties the cache"
+
+		with self.transaction() as conn:
+			conn.execute(f'DELETE FROM "{self.name}"')
+
+################################################################################
+def with_seq(df):
+	"Returns the rows of <df> with a sequence (not NGS samples, see sU.import_NGS)"
+
+	return df[df.SEQ.fillna("").astype(str) != ""]
+
+#-------------------------------------------------------------------------------
+def sequence_key(seq, engine):
+	"""
+	Returns the SHA-1 of mapping <engine> and <seq>, ignoring the case, gaps
+	and whitespace of the latter
+	"""
+
+	seq = re.sub(r"[\s-]", "", seq).upper()
+	return hashlib.sha1(f"{engine}:{seq}".encode()).hexdigest()
+
+#-------------------------------------------------------------------------------
+def bundle_version():
+	"""
+	Returns the hash of the <bundle_files>. Raises FileNotFoundError if any is
+	missing (e.g. a dangling link), rather than cache calls against it.
+	"""
+
+	sha1 = hashlib.sha1()
+	for fname in bundle_files:
+		sha1.update(os.path.basename(fname).encode())
+		with open(fname, "rb") as f: sha1.update(f.read())
+
+	return sha1.hexdigest()
+
+################################################################################
+cache = VariantCache(f"{data_dir}/dynamic/variant_cache.sqlite")
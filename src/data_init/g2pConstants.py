@@ -6,6 +6,33 @@ src = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
 data_dir = os.path.join(src, os.pardir, "data")
 archive_dir = os.path.join(data_dir, "archive")
 src, data_dir = map(os.path.abspath, (src, data_dir))
+
+# DynamicTable storage - "files" (feather/TSV + journal) or "sqlite"
+table_backend = os.environ.get("HSVG2P_BACKEND", "files")
+
+# Default number of threads for read mapping
+bwa_threads = min(8, os.cpu_count() or 1)
+
+# Number of threads scanning directories for input files (see g2pU.scan_files)
+scan_threads = 16
+
+# Number of FASTA records imported (and committed) at a time by SEQUENCES
+batch_records = 5000
+
+# Default minimum frequency (%) of the bases called from NGS tables by SEQUENCES --ngs
+ngs_min_freq = 1.0
+
+# Default number of worker processes for variant calling and PRA parsing (0 -
+# threads in the main process, see g2pU.row_executor)
+analysis_procs = 0
+
+# Shard-local data roots of SEQUENCES/PHENOS --shard, folded in by MERGE
+shard_dir = f"{data_dir}/shards"
+
+# Maximum number of sequences in the variant call cache (0 - no caching, see
+# g2pCache)
+variant_cache_size = 100000
+
 res_dict = {
 	"R": "RESISTANT", "R*": "LIKELY RESISTANT", "R?": "POSSIBLY RESISTANT",
 	"S": "SENSITIVE", "S*": "LIKELY SENSITIVE", "?": "AMBIGUOUS",
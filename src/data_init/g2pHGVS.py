@@ -0,0 +1,194 @@
+"""
+Compiled representation of the (modified) HGVS variant notation.
+
+Each variant has four components, separated by periods: the HSV type, the
+domain, the kind of variant ("p", "c" or "m") and its specifics, e.g.
+1.TK.c.436insG, 2.pol.p.S729N or 1.pol.m.12_15. <compile_HGVS> turns a column
+of such strings into a NumPy structured array (<dtype>) of integers, so that
+loci can be compared numerically rather than by regex:
+
+hsv		Index into <HSV_TYPES> (-1 if unknown)
+domain	Index into <DOMAINS> (-1 if unknown)
+kind	Index into <KINDS> (-1 for the "None" sentinel of unvaried sequences)
+start	First (or only) locus
+end		Last locus (== start for single loci)
+ref		Code of the reference residue(s) (see <allele_code>), 0 if absent
+op		Index into <OPS>: "" (locus only/missing), "sub", "ins", "del", "None"
+alt		Code of the alternative, inserted or deleted residue(s), 0 if absent
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+HSV_TYPES = ("1", "2", "2v")
+DOMAINS = ("TK", "pol", "UL5", "UL52")
+KINDS = ("p", "c", "m")
+OPS = ("", "sub", "ins", "del", "None")
+
+dtype = np.dtype([
+	("hsv", "i1"), ("domain", "i1"), ("kind", "i1"), ("start", "i4"),
+	("end", "i4"), ("ref", "i4"), ("op", "i1"), ("alt", "i4")
+])
+
+regex = re.compile(
+	r"(?P<hsv>[12]v?)\.(?P<domain>\w+?)\."
+	r"(?:(?P<kind>[pcm])\.(?P<ref>[A-Z\*]*?)(?P<start>\d{1,4})"
+	r"(?:[-_](?P<end>\d{1,4}))?(?P<alt>(?:ins|del)?[A-Z\*]*)"
+	r"|(?:[12]v?\.)?(?P<none>None))"
+)
+
+# Residue strings are interned as integer codes. Single residues are
+# pre-seeded so that their codes are the same in every process
+alleles = ["", *"ACDEFGHIKLMNPQRSTVWY*"]
+allele_codes = {allele: code for code, allele in enumerate(alleles)}
+
+################################################################################
+def allele_code(allele):
+	"Returns the integer code of a residue string, interning it if new"
+
+	if (code := allele_codes.get(allele)) is None:
+		code = allele_codes[allele] = len(alleles)
+		alleles.append(allele)
+	return code
+
+#-------------------------------------------------------------------------------
+def parse_HGVS(hgvs):
+	"""
+	Splits a single HGVS string into its string components - HSV type, domain,
+	kind, ref, locus (or "start-end" loci) and alt (None if absent). Returns
+	None if <hgvs> is not in HGVS format.
+	"""
+
+	if not (match := regex.fullmatch(str(hgvs).strip())): return None
+	if match["none"]: return (match["hsv"], match["domain"], None, "", "", "None")
+
+	loci = "-".join(filter(None, (match["start"], match["end"])))
+	return (
+		match["hsv"], match["domain"], match["kind"], match["ref"], loci,
+		match["alt"] or None
+	)
+
+#-------------------------------------------------------------------------------
+def compile_HGVS(hgvs):
+	"""
+	Compiles an array-like of HGVS strings into a structured array of <dtype>.
+	Each distinct string is parsed once (so categoricals compile in the time
+	taken by their categories). Strings not in HGVS format have all fields -1.
+	"""
+
+	codes, uniques = pd.factorize(pd.Series(hgvs, dtype=object))
+	df = pd.Series(uniques, dtype=object).str.strip().str.extract(regex.pattern)
+
+	def index(ser, values):
+		return ser.map(dict(zip(values, range(len(values))))).fillna(-1)
+
+	arr = np.full(len(df) + 1, -1, dtype=dtype)
+	parsed = df.hsv.notna().to_numpy()
+
+	arr["hsv"][:-1] = index(df.hsv, HSV_TYPES)
+	arr["domain"][:-1] = index(df.domain, DOMAINS)
+	arr["kind"][:-1] = index(df.kind, KINDS)
+	arr["start"][:-1] = pd.to_numeric(df.start).fillna(-1)
+	arr["end"][:-1] = pd.to_numeric(df.end.fillna(df.start)).fillna(-1)
+
+	alt = df.alt.fillna("")
+	op = np.select(
+		[df.none.notna(), alt.str.startswith("ins"), alt.str.startswith("del"),
+		 alt != ""],
+		[OPS.index("None"), OPS.index("ins"), OPS.index("del"), OPS.index("sub")],
+		OPS.index("")
+	)
+	arr["op"][:-1] = np.where(parsed, op, -1)
+	arr["ref"][:-1] = np.where(parsed, [*map(allele_code, df.ref.fillna(""))], -1)
+	arr["alt"][:-1] = np.where(
+		parsed, [*map(allele_code, alt.str.replace(r"^(?:ins|del)", "", regex=True))], -1
+	)
+
+	# Index -1 (missing values in <hgvs>) picks up the trailing all -1 record
+	return arr[codes]
+
+#-------------------------------------------------------------------------------
+def decompile_HGVS(arr):
+	"Returns HGVS strings from a structured array of <dtype> (loci joined by _)"
+
+	def decompile(rec):
+		if rec["hsv"] < 0: return None
+		hsv = HSV_TYPES[rec["hsv"]]
+		prefix = f"{hsv}.{DOMAINS[rec['domain']]}"
+		if (op := OPS[rec["op"]]) == "None": return f"{prefix}.{hsv}.None"
+
+		loci = "_".join(map(str, sorted({rec["start"], rec["end"]})))
+		alt = alleles[rec["alt"]]
+		if op in ("ins", "del"): alt = f"{op}{alt}"
+		return f"{prefix}.{KINDS[rec['kind']]}.{alleles[rec['ref']]}{loci}{alt}"
+
+	return [*map(decompile, arr)]
+
+#-------------------------------------------------------------------------------
+def code(values, value):
+	"Index of <value> in one of the code tuples (e.g. <DOMAINS>), or -1"
+
+	return values.index(value) if value in values else -1
+
+#-------------------------------------------------------------------------------
+def hsv_codes(hsv):
+	"""
+	Codes of the HSV types matching query type <hsv> - "2" matches both 2 and
+	2v, as per the "{h}v?" convention of locus searches.
+	"""
+
+	return [i for i, hsv_type in enumerate(HSV_TYPES) if hsv_type.startswith(str(hsv))]
+
+################################################################################
+class LocusIndex(object):
+	"""
+	A sorted index over the loci of compiled HGVS array <arr> (of <dtype>).
+	Each specific variant (substitution or indel - not bare loci or missing
+	data) is keyed by a single int64 composite of its HSV type, domain, kind
+	and start locus, so that all variants within a locus range are found by
+	binary search (see <find>). <positions> are the corresponding positions in
+	<arr>.
+	"""
+
+	specific = [OPS.index("sub"), OPS.index("ins"), OPS.index("del")]
+
+	def __init__(self, arr):
+		positions = np.flatnonzero(np.isin(arr["op"], self.specific))
+		arr = arr[positions]
+		keys = self.key(arr["hsv"], arr["domain"], arr["kind"], arr["start"])
+		order = np.argsort(keys, kind="stable")
+		self.keys, self.positions = keys[order], positions[order]
+
+	def __len__(self):
+		return len(self.keys)
+
+	@staticmethod
+	def key(hsv, domain, kind, locus):
+		"The composite key(s) - codes are offset by 1, as unknowns are -1"
+
+		hsv, domain, kind = (np.asarray(x, dtype=np.int64) + 1 for x in (hsv, domain, kind))
+		return (((hsv << 4 | domain) << 4 | kind) << 20) | np.asarray(locus, dtype=np.int64)
+
+	def find(self, hsv, domain, kind, start, end):
+		"""
+		Returns the positions of the variants of type <hsv> (see <hsv_codes>),
+		<domain> and <kind> ("p" or "c") starting at loci <start>..<end>
+		(inclusive), in locus order within each HSV type.
+		"""
+
+		domain, kind = code(DOMAINS, domain), code(KINDS, kind)
+		start, end = max(start, 0), max(end, -1)
+		bounds = [
+			np.searchsorted(self.keys, self.key(h, domain, kind, locus), side=side)
+			for h in hsv_codes(hsv)
+			for locus, side in ((start, "left"), (end, "right"))
+		]
+
+		return np.concatenate(
+			[self.positions[lo:hi] for lo, hi in zip(bounds[::2], bounds[1::2])]
+			or [np.array([], dtype=int)]
+		)
+
+################################################################################
@@ -0,0 +1,85 @@
+"""
+HSV-1 <-> HSV-2 homology maps, compiled from the static alignments.
+
+Each of <data_dir>/static/{domain}.{p|c}.aln aligns the HSV-1 (">1") and HSV-2
+(">2") sequences of a domain. For every domain, kind (protein "p" or coding
+"c") and HSV type, the alignment is compiled once into an integer array that
+maps each (1-based) locus onto the homologous locus of the other type - where
+the other type has a gap, the locus preceding the gap. The arrays are cached in
+<cache> (rebuilt whenever an alignment is newer), and loaded once per process,
+so that mapping a locus, or a whole range of loci, is an array lookup.
+"""
+
+import glob
+import os
+import threading
+
+import numpy as np
+
+from utils import gU
+from .g2pConstants import data_dir
+
+cache = f"{data_dir}/static/homology.npz"
+maps = None
+lock = threading.Lock()
+
+################################################################################
+def compile_maps():
+	"""
+	Returns a dict of "{domain}.{kind}.{hsv}" -> array, where array[locus] is
+	the homologous locus in the other HSV type (array[0] is unused)
+	"""
+
+	compiled = {}
+	for aln in sorted(glob.glob(f"{data_dir}/static/*.[pc].aln")):
+		stem = os.path.basename(aln)[:-len(".aln")]
+		seqs = dict(gU.fasta_parser(aln))
+
+		# Ragged alignments are padded with trailing gaps
+		width = max(map(len, seqs.values()), default=0)
+		seqs = {name[0]: np.frombuffer(seq.ljust(width, "-").encode(), dtype="S1") != b"-"
+				for name, seq in seqs.items()}
+		counts = {name: np.cumsum(is_base) for name, is_base in seqs.items()}
+
+		for query, target in (("1", "2"), ("2", "1")):
+			if query not in seqs or target not in seqs: continue
+			compiled[f"{stem}.{query}"] = np.concatenate(
+				([0], counts[target][seqs[query]])
+			).astype(np.int32)
+
+	return compiled
+
+#-------------------------------------------------------------------------------
+def load_maps():
+	"Returns the homology maps, compiling (and caching) them if necessary"
+
+	global maps
+
+	with lock:
+		if maps is not None: return maps
+
+		alns = glob.glob(f"{data_dir}/static/*.[pc].aln")
+		if os.path.exists(cache) \
+		and os.path.getmtime(cache) >= max(map(os.path.getmtime, alns), default=0):
+			with np.load(cache) as npz: maps = dict(npz)
+			return maps
+
+		maps = compile_maps()
+		try:
+			np.savez(tmp := f"{cache}.tmp.npz", **maps)
+			os.replace(tmp, cache)
+		except OSError:
+			gU.log.debug(f"Could not cache homology maps to {cache}")
+
+	return maps
+
+#-------------------------------------------------------------------------------
+def homologous_loci(domain, kind, hsv, loci):
+	"""
+	Maps <loci> (a locus or array of loci) of HSV type <hsv> in <domain> onto
+	the other HSV type. <kind> is "p" or "c". 2v is mapped as 2.
+	"""
+
+	return load_maps()[f"{domain}.{kind}.{str(hsv)[0]}"][np.asarray(loci)]
+
+################################################################################
@@ -0,0 +1,266 @@
+"""
+Storage backends for the g2p Tables.
+
+A Store knows how to read and write the DataFrame of a single Table to a single
+file. The plain tab-separated flatfile (TSVStore) is human-readable but loses
+every dtype on the way to disk. The columnar Stores (FeatherStore and
+ParquetStore) keep the dtypes and the index, and compress with ZSTD, so that the
+large DynamicTables (VARIANTS, EC50S) load without re-parsing or re-casting.
+
+Alternatively, all DynamicTables can be held in a single SQLite Database (see
+g2pTables.SQLTable), which allows concurrent imports and queries.
+"""
+
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from contextlib import contextmanager
+
+from utils import gU
+
+try:
+	import pyarrow as pa
+	from pyarrow import feather
+except ImportError:
+	pa = feather = None
+
+################################################################################
+class Store(object):
+	"""
+	Base class for all Stores. <stem> is the path to the Table file minus its
+	extension, which is supplied by the subclass (<ext>). <typed> flags whether
+	dtypes (and the index) survive the round trip to disk.
+	"""
+
+	ext = None
+	typed = False
+
+	def __init__(self, stem):
+		self.stem = stem
+		self.fname = f"{stem}.{self.ext}"
+
+	def __repr__(self):
+		return f"{type(self).__name__}({self.fname})"
+
+	def exists(self):
+		return os.path.exists(self.fname)
+
+	def read(self, **kwargs):
+		raise NotImplementedError
+
+	def write(self, df):
+		raise NotImplementedError
+
+#-------------------------------------------------------------------------------
+class TSVStore(Store):
+	"The original flatfile. **kwargs are passed to <gU.read_tsv>"
+
+	ext = "tsv"
+
+	def read(self, **kwargs):
+		return gU.read_tsv(self.fname, **kwargs)
+
+	def write(self, df):
+		gU.write_tsv(df, self.fname, index=True)
+
+#-------------------------------------------------------------------------------
+class FeatherStore(Store):
+	"Arrow IPC (feather v2) file, ZSTD-compressed"
+
+	ext = "feather"
+	typed = True
+
+	def read(self, **kwargs):
+		return feather.read_table(self.fname).to_pandas()
+
+	def write(self, df):
+		table = pa.Table.from_pandas(df, preserve_index=True)
+		feather.write_feather(table, tmp := f"{self.fname}.tmp", compression="zstd")
+		os.replace(tmp, self.fname)
+
+#-------------------------------------------------------------------------------
+class ParquetStore(Store):
+	"Parquet file, ZSTD-compressed"
+
+	ext = "parquet"
+	typed = True
+
+	def read(self, **kwargs):
+		return pd.read_parquet(self.fname)
+
+	def write(self, df):
+		df.to_parquet(tmp := f"{self.fname}.tmp", compression="zstd", index=True)
+		os.replace(tmp, self.fname)
+
+################################################################################
+class Journal(object):
+	"""
+	An append-only, tab-separated log of the changes made to a Table since its
+	Store was last written in full. Each line holds an operation (<OP>), the
+	row index (<INDEX>) and, for appended rows ("+"), the row itself. Deleted
+	rows are logged as tombstones ("-"). Replaying the log over the Store's
+	DataFrame recovers the current Table - the last operation on an index wins.
+	"""
+
+	def __init__(self, stem):
+		self.fname = f"{stem}.journal.tsv"
+		self.cols = None
+		self.n = 0
+
+	def __len__(self):
+		return self.n
+
+	def exists(self):
+		return os.path.exists(self.fname)
+
+	def entries(self, op, df):
+		"Returns <df> as journal entries for operation <op>"
+
+		df = df.copy()
+		df.insert(0, "OP", op)
+		return df.rename_axis("INDEX")
+
+	def log(self, entries):
+		"Appends <entries> (see <entries>) to the journal file"
+
+		if entries.empty: return
+		if self.cols is None: self.cols = entries.columns
+		entries.reindex(columns=self.cols).to_csv(
+			self.fname, sep="\t", mode="a", header=not self.exists()
+		)
+		self.n += len(entries)
+
+	def replay(self, df, numeric=()):
+		"""
+		Applies the journal to <df> and returns the result. Values are read as
+		logged (e.g. empty strings stay empty), bar those of numeric columns
+		(and <numeric>), where an empty value is NaN.
+		"""
+
+		if not self.exists(): return df
+
+		journal = pd.read_csv(
+			self.fname, sep="\t", index_col="INDEX", dtype=str, keep_default_na=False
+		)
+		journal.index = journal.index.astype(df.index.dtype)
+		self.cols, self.n = journal.columns, len(journal)
+
+		journal = journal[~journal.index.duplicated(keep="last")]
+		rows = journal[journal.pop("OP") == "+"].reindex(columns=df.columns)
+
+		# Categoricals are left to the Table, as the log may add categories
+		for col, dtype in df.dtypes.items():
+			if isinstance(dtype, pd.CategoricalDtype): continue
+			if pd.api.types.is_datetime64_any_dtype(dtype):
+				rows[col] = pd.to_datetime(rows[col], format="ISO8601")
+			else:
+				if col in numeric or pd.api.types.is_numeric_dtype(dtype):
+					rows[col] = pd.to_numeric(rows[col].mask(rows[col] == ""))
+				try: rows[col] = rows[col].astype(dtype)
+				except (TypeError, ValueError): pass
+
+		df = df[~df.index.isin(journal.index)]
+		return pd.concat((df, rows)).sort_index()
+
+	def clear(self):
+		if self.exists(): os.remove(self.fname)
+		self.cols, self.n = None, 0
+
+################################################################################
+class Database(object):
+	"""
+	A single SQLite file holding the SQL-backed Tables. It is opened in WAL
+	mode, so that readers are never blocked by a writer. Each thread has its
+	own connection (in autocommit mode). <transaction> is re-entrant - only the
+	outermost call on a thread begins and commits, so that nested operations
+	(e.g. cascading deletes) join the caller's transaction.
+	"""
+
+	def __init__(self, fname, timeout=600):
+		self.fname = fname
+		self.timeout = timeout
+		self.local = threading.local()
+
+	def __repr__(self):
+		return f"Database({self.fname})"
+
+	@property
+	def conn(self):
+		"The connection for the current thread, opened if necessary"
+
+		if (conn := getattr(self.local, "conn", None)) is None:
+			conn = sqlite3.connect(
+				self.fname, timeout=self.timeout, isolation_level=None,
+				check_same_thread=False
+			)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=NORMAL")
+			self.local.conn, self.local.depth = conn, 0
+
+		return conn
+
+	@contextmanager
+	def transaction(self):
+		"Wraps a block in a single (write) transaction"
+
+		conn = self.conn
+		if self.local.depth == 0: conn.execute("BEGIN IMMEDIATE")
+		self.local.depth += 1
+
+		try:
+			yield conn
+		except BaseException:
+			if (depth := self.local.depth - 1) == 0: conn.execute("ROLLBACK")
+			raise
+		else:
+			if (depth := self.local.depth - 1) == 0: conn.execute("COMMIT")
+		finally:
+			self.local.depth = depth
+
+	def create(self, name, cols, types={}, indexed=(), unique=()):
+		"""
+		Creates Table <name> (if not present), with an integer primary key <idx>
+		and columns <cols> (SQL types from <types>). Each of the <indexed>
+		columns is indexed, and the <unique> columns form a unique index. Any
+		<cols> missing from an existing Table are added (as NULL).
+		Returns True if the Table is new.
+		"""
+
+		quote = lambda cols: ", ".join(f'"{col}"' for col in cols)
+		cols_sql = ", ".join(f'"{col}" {types.get(col, "")}'.strip() for col in cols)
+
+		with self.transaction() as conn:
+			new = not conn.execute(
+				"SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name, )
+			).fetchone()
+			conn.execute(
+				f'CREATE TABLE IF NOT EXISTS "{name}" (idx INTEGER PRIMARY KEY, {cols_sql})'
+			)
+			present = {row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')}
+			for col in [col for col in cols if col not in present]:
+				conn.execute(
+					f'ALTER TABLE "{name}" ADD COLUMN "{col}" {types.get(col, "")}'.strip()
+				)
+			for col in indexed:
+				conn.execute(
+					f'CREATE INDEX IF NOT EXISTS "{name}_{col}" ON "{name}" ("{col}")'
+				)
+			if unique: conn.execute(
+				f'CREATE UNIQUE INDEX IF NOT EXISTS "{name}_key" ON "{name}" ({quote(unique)})'
+			)
+
+		return new
+
+	def checkpoint(self):
+		"Folds the write-ahead log back into the main database file"
+
+		self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+################################################################################
+# FeatherStore is the default for DynamicTables wherever pyarrow is installed
+default_store = TSVStore if feather is None else FeatherStore
+
+################################################################################
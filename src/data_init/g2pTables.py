@@ -1,11 +1,19 @@
+import atexit
+import json
 import os
-import re
+import threading
 
 import itertools as it
+import numpy as np
 import pandas as pd
 
+from contextlib import nullcontext
+from functools import reduce
+
 from utils import gU
 from .g2pConstants import *
+from . import g2pHGVS as g2pH
+from .g2pStorage import Database, Journal, TSVStore, default_store
 
 ################################################################################
 class Table(object):
@@ -16,11 +24,12 @@ class Table(object):
 	StaticTable to reflect the data and reference Tables, respectively.
 
 	<name> and <location> combine to give <fname>. <location> specifies the sub-
-	folder within /HSVg2p/data in which the tab-separated flatfile containing
-	the Table data is stored. <cols> stores the column names and is useful for a
-	number of operations. **kwargs are passed to the <read_tsv> module function
-	to allow subclasses to specify behaviours (useful when the file doesn't yet
-	exist).
+	folder within /HSVg2p/data in which the file containing the Table data is
+	stored. <store> is the Store class (see g2pStorage) that reads and writes
+	that file - the tab-separated flatfile by default. <cols> stores the column
+	names and is useful for a number of operations. **kwargs are passed to the
+	<read_tsv> module function to allow subclasses to specify behaviours (useful
+	when the file doesn't yet exist).
 
 	methods
 	-------
@@ -33,21 +42,75 @@ class Table(object):
 			by passing a function. The default is set.intersection. For any of
 			the filters to be true, then pass set.union.
 
+	Columns named in <indexed> get an inverted index (value -> sorted array of
+	row positions), built the first time the column is filtered and discarded
+	whenever <df> is reassigned (e.g. by <append> or <delete>). Filters are
+	resolved to row positions and combined as sorted integer arrays.
+
+	Likewise, <hgvs> holds the compiled HGVS column (see g2pHGVS), aligned with
+	the rows of <df>, and <loci> a sorted LocusIndex over it, so that locus
+	range queries are answered by binary search.
+
 	"""
+	indexed = ("HGVS", "PARENT_ID", "MOLIS", "DRUG")
+	array_ops = {set.intersection: np.intersect1d, set.union: np.union1d}
+
 	def __init__(self, name, location, **kwargs):
 
 		self.name = name
 		self.location = location
 		root = kwargs.pop("root", data_dir)
-		self.fname = f"{root}/{self.location}/{name}.tsv"
+		self.store = kwargs.pop("store", TSVStore)(f"{root}/{location}/{name}")
+		self.fname = self.store.fname
 
 		kwargs.setdefault("index_col", 0)
-		self.df = gU.read_tsv(self.fname, **kwargs)
+		self.df = self.read(**kwargs)
 		self.cols = self.df.columns
 
 	def __repr__(self):
 		return self.df.to_string()
 
+	@property
+	def df(self):
+		return self._df
+
+	@df.setter
+	def df(self, df):
+		self._df = df
+		self._indexes = {}
+		self._hgvs = self._loci = None
+
+	@property
+	def hgvs(self):
+		"The compiled <HGVS> column (or index) of <df>, compiled if necessary"
+
+		if self._hgvs is None:
+			hgvs = self.df.HGVS if "HGVS" in self.df.columns else self.df.index
+			self._hgvs = g2pH.compile_HGVS(hgvs)
+		return self._hgvs
+
+	@property
+	def loci(self):
+		"The LocusIndex (see g2pHGVS) of <hgvs>, built if necessary"
+
+		if self._loci is None: self._loci = g2pH.LocusIndex(self.hgvs)
+		return self._loci
+
+	def read(self, **kwargs):
+		return self.store.read(**kwargs)
+
+	def get_index(self, col):
+		"Returns the inverted index of <col>, building it if necessary"
+
+		if (index := self._indexes.get(col)) is None:
+			codes, uniques = pd.factorize(self.df[col])
+			order = np.argsort(codes, kind="stable")[(codes < 0).sum():]
+			bounds = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))
+			index = dict(zip(uniques, np.split(order, bounds[:-1])))
+			self._indexes[col] = index
+
+		return index
+
 	def filter(self, filters, inverse=False, index=False, setop=set.intersection):
 		"""
 		Returns the sub_df where all <filters> are satisfied. <filters> is a
@@ -58,26 +121,43 @@ class Table(object):
 		(The intersection of all indices...)
 		"""
 		def single_filter(col_val, inv):
+			"Returns the sorted row positions satisfying a single filter"
 			col, val = col_val
 			val = gU.parse_input_data(val)
 
-			if col == "index":
-				if isinstance(self.df.index, pd.MultiIndex):
-					val = [*gU.iter_zip(self.df.index.nlevels, val)]
-				boolean = self.df.index.isin(val)
-			else: boolean = self.df[col].isin(val)
-			if inv: boolean = ~boolean
-			return set(self.df[boolean].index)
+			if col in self.indexed and col in self.df.columns:
+				index = self.get_index(col)
+				positions = np.unique(np.concatenate(
+					[index.get(v, empty) for v in val] or [empty]
+				))
+			else:
+				if col == "index":
+					if isinstance(self.df.index, pd.MultiIndex):
+						val = [*gU.iter_zip(self.df.index.nlevels, val)]
+					boolean = self.df.index.isin(val)
+				else: boolean = self.df[col].isin(val)
+				positions = np.flatnonzero(boolean)
+
+			if inv: positions = np.setdiff1d(np.arange(len(self.df)), positions)
+			return positions
+
+		def combine(*arrays):
+			if (arrop := self.array_ops.get(setop)): return reduce(arrop, arrays)
+			return np.array(sorted(setop(*map(set, arrays))), dtype=int)
 
 		if self.df.empty: return self.df
 		if type(filters[0]) != tuple: filters = (filters, )
 		if type(inverse) == bool: inverse = it.repeat(inverse, len(filters))
 
-		indices = sorted(
-			setop(*it.starmap(single_filter, zip(filters, inverse)))
-		)
-		if index: return indices
-		df = self.df.loc[indices]
+		empty = np.array([], dtype=int)
+		positions = combine(*it.starmap(single_filter, zip(filters, inverse)))
+
+		# Rows are returned in index order, as per <df.loc[sorted(indices)]>
+		if not self.df.index.is_monotonic_increasing:
+			positions = positions[self.df.index[positions].argsort(kind="stable")]
+
+		if index: return self.df.index[positions].tolist()
+		df = self.df.iloc[positions]
 		return df
 
 #-------------------------------------------------------------------------------
@@ -86,72 +166,365 @@ class DynamicTable(Table):
 	A subclass of Table, with additional __init__ actions and new functions:
 	<delete>	allows propagation into "child" Tables so that all data relating
 				to an entry is removed from all files.
-	<append>	merges a new DataFrame with the existing Table, thus precluding
-				duplicates. Returns the new DF but with revised indexes, plus
-				the indexes of new entries only.
-	<write>		saves the Table "as-is" to file. Not automatic, so needs to be
+	<append>	adds the rows of a new DataFrame not already in the Table, as
+				identified by their <key> (the natural key of the Table - all
+				<cols> by default). Returns the new DF but with revised indexes,
+				plus the indexes of new entries only.
+	<write>		saves the changes to the Table. Not automatic, so needs to be
 				explicit in the script.
+	<compact>	saves the Table "as-is" to file, emptying the journal.
+
+	DynamicTables are stored in a typed, columnar format (<default_store>)
+	wherever possible. The first time such a Table is read, the legacy TSV is
+	parsed, cast and re-saved in the new format, so that the casting is not
+	repeated on every load.
+
+	Rather than re-writing the whole file, <write> appends new rows and
+	tombstones of deleted rows to a journal (see g2pStorage.Journal), which is
+	replayed on reading. The journal is compacted into the main file once it
+	exceeds <compact_ratio> of the Table (and <compact_min> rows), or whenever
+	the existing rows have been changed (e.g. by sorting or re-indexing).
+
+	Columns listed in <categories> (low-cardinality strings such as HGVS, DRUG
+	or MOLIS) are held as pandas categoricals, from reading, through <append>,
+	to writing.
 	"""
 
-	def __init__(self, name, cols, child=[]):
+	compact_ratio = 0.1
+	compact_min = 1000
+	numeric = ("FREQ", )	# Columns left as NaN by <append>, rather than filled
+
+	def __init__(self, name, cols, child=None, key=None, categories=(),
+				 store=default_store, root=None):
 		self.child = child
-		super().__init__(name, location="dynamic", cols=cols)
+		self.categories = categories
+		self.keys = None
+		self.pending = []
+		self.dirty = False
+		super().__init__(
+			name, location="dynamic", cols=cols, store=store, root=root or dynamic_root
+		)
+		self.key = key or [*self.cols]
+
+		# Columns added since the Table was written (e.g. VARIANTS.FREQ) are
+		# filled with NaN, and the whole Table re-written on the next <write>
+		if missing := [col for col in cols if col not in self.cols]:
+			self.df = self.df.reindex(columns=[*self.cols, *missing])
+			self.cols, self.dirty = self.df.columns, True
+
+	def read(self, **kwargs):
+		"Reads the Table, migrating from the legacy TSV where necessary"
+
+		self.journal = Journal(self.store.stem)
+		if self.store.typed and self.store.exists():
+			return self.categorise(self.journal.replay(self.store.read(), self.numeric))
+
+		tsv = TSVStore(self.store.stem)
+		df = tsv.read(**kwargs)
+
+		if "DATE" in df.columns:
+			df.DATE = pd.to_datetime(df.DATE, format="ISO8601")
+		if "PARENT_ID" in df.columns:
+			df = df.astype({"PARENT_ID": int})
+
+		if self.store.typed and tsv.exists():
+			gU.log.info(f"Migrating {tsv.fname} to {self.store.ext} format")
+			self.store.write(df)
+
+		return self.categorise(self.journal.replay(df, self.numeric))
+
+	def categorise(self, df):
+		"Casts the <categories> columns of <df> to categoricals"
+
+		cols = [col for col in self.categories if col in df.columns]
+		return df.astype(dict.fromkeys(cols, "category"))
+
+	def add_categories(self, df):
+		"""
+		Extends the categories of the Table's categoricals with any new values
+		in <df>, and casts <df> to the same categoricals so that they can be
+		concatenated without losing the dtypes.
+		"""
+
+		df = df.copy()
+		for col in self.categories:
+			if col not in df.columns or col not in self.df.columns: continue
+			if not isinstance(self.df[col].dtype, pd.CategoricalDtype): continue
 
-		if "DATE" in self.df.columns:
-			self.df.DATE = pd.to_datetime(self.df.DATE, format="%Y-%m-%d")
-		if "PARENT_ID" in self.df.columns:
-			self.df = self.df.astype({"PARENT_ID": int})
+			values = pd.Index(df[col].dropna().unique())
+			if len(new := values.difference(self.df[col].cat.categories)):
+				self.df[col] = self.df[col].cat.add_categories(new)
+			df[col] = pd.Categorical(df[col], dtype=self.df[col].dtype)
+
+		return df
 
 	def append(self, df, *,
 			   fill="", sort_cols=[], reset=False):
 		"""
-		Appends <df> data to a Table.df, checking (and removing) duplicates via
-		pd.merge, and filling spaces with <fill>. The following actions are
-		performed in order (i.e. reset will follow a sort):
+		Appends <df> data to a Table.df, checking (and removing) duplicates by
+		looking up the <key> of each row in <get_keys>, and filling spaces in
+		new rows with <fill> (bar <numeric> columns). New rows take the next
+		free indexes. The following actions are then performed in order (i.e.
+		reset will follow a sort):
 		- sort		Sorts the Table.df by the columns in <sort>
 		- reset		Resets the index after concatenation
-		- write		Finally, the table is saved to file by default
 
 		returns:
-		- index
-
-		The <result> variable can take one of two values, determining how much
-		of the input DataFrame is returned. Both returned DFs are re-indexed
-		with the corresponding indexes of the the updated Table.:
-		["all"]		Returns the entire input DF.
-		"new"		Returns only that part of the input DF that was not already
-					present in the Table prior to the update.
+		- index		The indexes of the new entries only
+		- df		The entire input DF, de-duplicated and re-indexed with the
+					indexes of the corresponding entries in the updated Table
 		"""
 
-		index = self.df.index
-		print("\nName", self.name)
-		print("index", index)
-		print("df")
-		print(df)
-		self.df = self.df.merge(df, how="outer").fillna(fill)
+		df = df.reindex(columns=self.df.columns)
+		keys = pd.Series([*self.iter_keys(df)], index=df.index, dtype=object)
+		df, keys = df[~keys.duplicated()], keys[~keys.duplicated()]
 
-		if sort_cols: self.df = self.df.sort_values(sort_cols)
-		if reset: self.df = self.df.reset_index(drop=True)
+		table_keys = self.get_keys()
+		indexes = keys.map(table_keys.get).to_numpy(dtype=float, na_value=np.nan, copy=True)
+		new = np.isnan(indexes)
+
+		start = self.df.index.max() + 1 if not self.df.empty else 0
+		index = pd.RangeIndex(start, start + new.sum())
+		indexes[new] = index
+		table_keys.update(zip(keys[new], index))
 
-		dups = pd.concat((self.df, df)).duplicated(keep="last")
-		df = self.df.loc[dups[dups].index]
-		index = df.index.difference(index)
-		print("index", index)
-		print("df")
-		input(df)
+		new_df = self.add_categories(df[new].fillna(self.fills(df, fill)).set_axis(index))
+		if self.df.empty: new_df = self.categorise(new_df)
+		self.df = pd.concat((self.df, new_df)) if not self.df.empty else new_df
+		self.pending.append(self.journal.entries("+", new_df))
 
+		# Sorting and resetting change existing rows, so the Table is re-written
+		if sort_cols: self.df = self.df.sort_values(sort_cols)
+		if reset:
+			self.df = self.df.reset_index(drop=True)
+			self.keys = None
+			indexes = keys.map(self.get_keys().get).to_numpy()
+			index = pd.Index(indexes[new])
+		self.dirty |= bool(sort_cols or reset)
+
+		df = self.df.loc[indexes.astype(int)]
 		return index, df
 
-	def delete(self, indexes):
+	def fills(self, df, fill):
+		"Returns the <fill> for each column of <df>, except <numeric> columns"
 
-		if (child := self.child) is not None:
-			indexes = child.filter(("PARENT_ID", indexes), index=True)
-			child.delete(indexes)
-		self.df = self.df[~self.df.index.isin(indexes)]
+		return {col: fill for col in df.columns if col not in self.numeric}
+
+	def get_keys(self):
+		"Returns the dict of <key> values -> index, building it if necessary"
+
+		if self.keys is None:
+			self.keys = dict(zip(self.iter_keys(self.df), self.df.index))
+		return self.keys
+
+	def iter_keys(self, df):
+		"Yields the <key> values of each row of <df> as a tuple"
+
+		return zip(*(df[col] for col in self.key))
+
+	def delete(self, indexes):
+		"Deletes rows <indexes>, and all rows in <child> Tables that link to them"
+
+		if (child := self.child) is not None and not child.df.empty:
+			child.delete(child.filter(("PARENT_ID", indexes), index=True))
+
+		indexes = self.df.index[self.df.index.isin(indexes)]
+		# Tombstones carry the columns, in case they start a new journal
+		tombstones = pd.DataFrame(index=indexes, columns=self.df.columns)
+		self.pending.append(self.journal.entries("-", tombstones))
+		# Legacy rows may share a key, so it may already have been popped
+		if self.keys is not None:
+			for key in self.iter_keys(self.df.loc[indexes]): self.keys.pop(key, None)
+		self.df = self.df.drop(indexes)
 		self.write()
 
 	def write(self):
-		gU.write_tsv(self.df, self.fname, index=True)
+		"Journals any pending changes, compacting the journal where necessary"
+
+		if self.pending: self.journal.log(pd.concat(self.pending))
+		self.pending = []
+
+		if self.dirty or not self.store.exists() \
+		or len(self.journal) > max(self.compact_min, self.compact_ratio * len(self.df)):
+			self.compact()
+
+	def compact(self):
+		"Writes the whole Table to its Store and clears the journal"
+
+		self.store.write(self.df)
+		self.journal.clear()
+		self.pending, self.dirty = [], False
+
+#-------------------------------------------------------------------------------
+class SQLTable(DynamicTable):
+	"""
+	A DynamicTable held in a shared SQLite Database (<db>) rather than a file of
+	its own, with the same <filter>, <append> and <delete> methods. Filters are
+	run as SQL queries against indexed columns (<indexed>), and <df> is only
+	read (in full) when it is used directly. Each <append> and (cascading)
+	<delete> is a single transaction, or joins the enclosing one - see the
+	module-level <transaction>. Rows are de-duplicated over <key>, which has a
+	unique index.
+
+	On creation, the Table is populated from its file-based equivalent (under
+	<root>), if there is one. <sort_cols> and <reset> have no meaning for an
+	SQL Table, and are ignored by <append>. <write> is redundant, as each
+	change is committed with its transaction.
+	"""
+
+	types = {"PARENT_ID": "INTEGER", "DATE": "TEXT", "FREQ": "REAL"}
+	date_format = "%Y-%m-%d %H:%M:%S"
+
+	def __init__(self, name, cols, child=None, key=None, categories=(), db=None,
+				 root=None):
+		self.name = name
+		self.location = "dynamic"
+		self.root = root or dynamic_root
+		self.child = child
+		self.categories = categories
+		self.key = key or cols
+		self.cols = pd.Index(cols)
+		self.db = db or (Database(f"{root}/dynamic/g2p.sqlite") if root else database)
+		self.fname = self.db.fname
+		self.df = None
+
+		indexed = [col for col in self.indexed if col in cols]
+		if self.db.create(name, cols, self.types, indexed, unique=self.key):
+			self.migrate()
+
+	@property
+	def df(self):
+		if self._df is None: self._df = self.query()
+		return self._df
+
+	@df.setter
+	def df(self, df):
+		self._df = df
+		self._indexes = {}
+		self._hgvs = self._loci = None
+
+	def migrate(self):
+		"Copies the rows of any file-based Table <name> into the database"
+
+		self.store = default_store(f"{self.root}/{self.location}/{self.name}")
+		df = DynamicTable.read(self, cols=self.cols, index_col=0)
+		if df.empty: return
+
+		gU.log.info(f"Migrating {self.name} to {self.db.fname}")
+		with self.db.transaction() as conn:
+			self.insert(conn, df, index=True)
+
+	def sql_values(self, values):
+		"Converts values (e.g. numpy integers, Timestamps) to SQL-ready values"
+
+		def convert(value):
+			if isinstance(value, pd.Timestamp): return value.strftime(self.date_format)
+			return value.item() if isinstance(value, np.generic) else value
+
+		return [*map(convert, values)]
+
+	def insert(self, conn, df, index=False):
+		"Inserts <df>, skipping duplicates, optionally keeping its index as <idx>"
+
+		df = df.reindex(columns=self.cols)
+		if "DATE" in df.columns and pd.api.types.is_datetime64_any_dtype(df.DATE):
+			df["DATE"] = df.DATE.dt.strftime(self.date_format)
+
+		cols = (["idx"] if index else []) + [*self.cols]
+		quote = lambda col: f'"{col}"'
+		rows = df.itertuples(index=index, name=None)
+		conn.executemany(
+			f'INSERT OR IGNORE INTO "{self.name}" ({", ".join(map(quote, cols))}) '
+			f'VALUES ({", ".join("?" * len(cols))})',
+			map(self.sql_values, rows)
+		)
+
+	def query(self, where="1", params=()):
+		"Returns the rows satisfying SQL <where> (with <params>) in index order"
+
+		df = pd.read_sql_query(
+			f'SELECT * FROM "{self.name}" WHERE {where} ORDER BY idx',
+			self.db.conn, params=params, index_col="idx"
+		).rename_axis(None)
+		if "DATE" in df.columns:
+			df["DATE"] = pd.to_datetime(df.DATE, format=self.date_format)
+
+		return self.categorise(df)
+
+	def filter(self, filters, inverse=False, index=False, setop=set.intersection):
+		"As <Table.filter>, but run as a single SQL query"
+
+		if setop not in self.array_ops:
+			return super().filter(filters, inverse, index, setop)
+
+		if type(filters[0]) != tuple: filters = (filters, )
+		if type(inverse) == bool: inverse = it.repeat(inverse, len(filters))
+
+		clauses, params = [], []
+		for (col, val), inv in zip(filters, inverse):
+			col = "idx" if col == "index" else col
+			clauses.append(
+				f'"{col}" {"NOT " * inv}IN (SELECT value FROM json_each(?))'
+			)
+			params.append(json.dumps(self.sql_values(gU.parse_input_data(val))))
+
+		joiner = " AND " if setop is set.intersection else " OR "
+		df = self.query(joiner.join(clauses), params)
+
+		if index: return df.index.tolist()
+		return df
+
+	def append(self, df, *,
+			   fill="", sort_cols=[], reset=False):
+		"""
+		Inserts the rows of <df> not already present in the Table. As per
+		<DynamicTable.append>, returns the indexes of the new rows, and <df>
+		re-indexed with the indexes of the corresponding rows in the Table.
+		"""
+
+		df = df.reindex(columns=self.cols)
+		df = df.fillna(self.fills(df, fill))
+		df = df[~df.duplicated(self.key)]
+
+		# The index of each row is looked up in a single join of the keys (as a
+		# JSON array, by position) with the Table, over the unique <key> index
+		keys = json.dumps([*map(self.sql_values, self.iter_keys(df))])
+		match = " AND ".join(
+			f'"{self.name}"."{col}" IS json_extract(value, \'$[{i}]\')'
+			for i, col in enumerate(self.key)
+		)
+
+		with self.db.transaction() as conn:
+			top, = conn.execute(f'SELECT coalesce(max(idx), -1) FROM "{self.name}"').fetchone()
+			self.insert(conn, df)
+			indexes = dict(conn.execute(
+				f'SELECT key, idx FROM json_each(?) JOIN "{self.name}" ON {match}', (keys, )
+			).fetchall())
+			df.index = [indexes[i] for i in range(len(df))]
+
+		self.df = None
+		return df.index[df.index > top], df
+
+	def delete(self, indexes):
+		"Deletes rows <indexes>, and all rows in <child> Tables that link to them"
+
+		indexes = self.sql_values(gU.parse_input_data(indexes))
+
+		with self.db.transaction() as conn:
+			if (child := self.child) is not None:
+				child.delete(child.filter(("PARENT_ID", indexes), index=True))
+			conn.execute(
+				f'DELETE FROM "{self.name}" WHERE idx IN (SELECT value FROM json_each(?))',
+				(json.dumps(indexes), )
+			)
+
+		self.df = None
+
+	def write(self):
+		pass
+
+	def compact(self):
+		self.db.checkpoint()
 
 #-------------------------------------------------------------------------------
 class StaticTable(Table):
@@ -168,61 +541,145 @@ class StaticTable(Table):
 class LiteratureTable(StaticTable):
 	"""
 	A subclass of StaticTable, specifically for Tables with geno-to-pheno info
-	gleaned from the literature. Expands the <__init__> function to parse the
-	HGVS.
+	gleaned from the literature. Expands the <__init__> function to compile the
+	HGVS and its LocusIndex (see <Table.loci>) up front, as these Tables are
+	searched by locus.
 	"""
 
 	def __init__(self, name, **kwargs):
 		super().__init__(name, **kwargs)
-		if not self.df.empty:
-			df = pd.DataFrame.from_records(
-				self.df.index.map(parse_HGVS),
-				index=self.df.index,
-				columns=list("HDPVL")
-			)
-			self.df = pd.concat((self.df, df), axis=1)
+		self.loci
+
+################################################################################
+class LazyTable(object):
+	"""
+	Stands in for a Table at module level, so that importing this module reads
+	no files. The Table (of class <cls>) is only created, and its file read, on
+	first access to any of its attributes, which are then passed through to it.
+	The names of all Tables read in the process are kept in <loaded>. <at>
+	reads the same Table from another data root (e.g. a shard - see
+	<set_dynamic_root>).
+	"""
+
+	loaded = []
+
+	def __init__(self, cls, name, **kwargs):
+		object.__setattr__(self, "_args", (cls, name, kwargs))
+		object.__setattr__(self, "_table", None)
+		object.__setattr__(self, "_lock", threading.Lock())
+
+	def __getattr__(self, attr):
+		return getattr(self.load(), attr)
+
+	def __setattr__(self, attr, value):
+		setattr(self.load(), attr, value)
+
+	def __repr__(self):
+		return repr(self.load())
+
+	def load(self):
+		"Returns the Table, reading it first if necessary"
+
+		with self._lock:
+			if self._table is None:
+				cls, name, kwargs = self._args
+				object.__setattr__(self, "_table", cls(name, **kwargs))
+				LazyTable.loaded.append(name)
+
+		return self._table
+
+	def at(self, root):
+		"Returns the Table as stored under <root>, without any <child>"
+
+		cls, name, kwargs = self._args
+		return cls(name, **{**kwargs, "child": None, "root": root})
 
 #-------------------------------------------------------------------------------
-def parse_HGVS(hgvs):
+@atexit.register
+def report_tables():
+	"Logs the Tables that were actually read by the (sub)command"
+
+	gU.log.info(f"Tables read: {', '.join(LazyTable.loaded) or 'none'}")
 
-	parsed = hgvs.split(".")
-	parsed.append(int(re.search(r"\d{1,4}", parsed[-1]).group(0)))
+#-------------------------------------------------------------------------------
+def transaction():
+	"""
+	Groups all changes to the DynamicTables made within the block into a single
+	transaction (SQL-backed Tables only - file-backed Tables are unaffected).
+	"""
 
-	return parsed
+	return database.transaction() if Dynamic is SQLTable else nullcontext()
+
+#-------------------------------------------------------------------------------
+def set_dynamic_root(root):
+	"""
+	Keeps the DynamicTables (and their Database) under <root>/dynamic rather
+	than <data_dir>/dynamic - e.g. a shard (see g2pU.set_shard). Must be called
+	before any Table is read.
+	"""
+
+	global dynamic_root, database
+
+	if LazyTable.loaded:
+		raise RuntimeError(f"Tables already read: {', '.join(LazyTable.loaded)}")
+
+	os.makedirs(f"{root}/dynamic", exist_ok=True)
+	dynamic_root = root
+	database = Database(f"{root}/dynamic/g2p.sqlite")
 
 "SET UP TABLES FROM DATA TSVs"
 
+# <table_backend> (see g2pConstants) selects file-based or SQL DynamicTables,
+# kept under <dynamic_root>/dynamic (see <set_dynamic_root>)
+dynamic_root = data_dir
+database = Database(f"{data_dir}/dynamic/g2p.sqlite")
+Dynamic = SQLTable if table_backend == "sqlite" else DynamicTable
+
+# Each Table is wrapped in a LazyTable, and so is only read when first used
+#
 # DynamicTables - these get updated with new data
 #	mol		MOLIS IDs, with HSV types - True for present in sample.
 #			Also maps older MOLIS IDs to HSV type, based upon an MMD download
 # 	fil		FILES, with source RUN ID, date of run etc.
 #	fas		FASTA sequences, with an ID link (child relationship) to <fil>
-#	var		Variants detected in FASTAs, with a child relationship to <fas>
+#	var		Variants detected in FASTAs, with a child relationship to <fas>. FREQ
+#			is the frequency (%) of NGS variants (see sU.import_NGS), else NaN
 #	phe		PRA files
 #	sir		Susceptibilities from PRAs, with a child relationship to <phe>
+#	man		Manifest of the input files seen - PATH, SIZE, MTIME and
+#			content HASH, so that only new or changed files are parsed
+
+var = LazyTable(
+	Dynamic, "VARIANTS", cols=["HGVS", "PARENT_ID", "FREQ"],
+	key=["HGVS", "PARENT_ID"], categories=["HGVS"]
+)
 
-var = DynamicTable(
-	"VARIANTS", cols=["HGVS", "PARENT_ID"]
+fas = LazyTable(
+	Dynamic, "FASTAS", child=var, cols=["NAME", "MOLIS", "SEQ", "PARENT_ID"],
+	key=["NAME", "PARENT_ID"], categories=["MOLIS"]
 )
 
-fas = DynamicTable(
-	"FASTAS", child=var, cols=["NAME", "MOLIS", "SEQ", "PARENT_ID"]
+fil = LazyTable(
+	Dynamic, "FILES", child=fas, cols=["LOCATION", "FILENAME", "DATE", "RUNID"],
+	key=["LOCATION", "FILENAME"], categories=["RUNID"]
 )
 
-fil = DynamicTable(
-	"FILES", child=fas, cols=["LOCATION", "FILENAME", "DATE", "RUNID"]
+ec50 = LazyTable(
+	Dynamic, "EC50S",  cols=["DATE", "DRUG",  "CTRL", "EC50", "PARENT_ID"],
+	key=["DRUG", "PARENT_ID"], categories=["DRUG"]
 )
 
-ec50 = DynamicTable(
-	"EC50S",  cols=["DATE", "DRUG",  "CTRL", "EC50", "PARENT_ID"]
+phe = LazyTable(
+	Dynamic, "PHENOS", child=ec50, cols=["LOCATION", "FILENAME", "MOLIS"],
+	key=["LOCATION", "FILENAME"], categories=["MOLIS"]
 )
 
-phe = DynamicTable(
-	"PHENOS", child=ec50, cols=["LOCATION", "FILENAME", "MOLIS"]
+mol = LazyTable(
+	Dynamic, "MOLIS", cols=["MOLIS", "1", "2", "2v"]
 )
 
-mol = DynamicTable(
-	"MOLIS", cols=["MOLIS", "1", "2", "2v"]
+man = LazyTable(
+	Dynamic, "MANIFEST", cols=["PATH", "SIZE", "MTIME", "HASH"], key=["PATH"]
 )
 
 # StaticTables - these contain fixed reference information
@@ -237,11 +694,11 @@ mol = DynamicTable(
 #			g2p, combining literature, phenotyping and other sources. Overrules
 #			both <raw> and <lit>.
 
-lit = StaticTable("INTERPRETATIONS", index_col=False)
-res = StaticTable("RESOLVED", index_col=False)
-thr  = StaticTable("THRESHOLDS", index_col=[0, 1])
-raw = StaticTable("LITERATURE", index_col=False)
-cit = StaticTable("CITATIONS", index_col=0, comment="\"")
-tgt = StaticTable("TARGETS", index_col=0)
+lit = LazyTable(LiteratureTable, "INTERPRETATIONS", index_col=False)
+res = LazyTable(LiteratureTable, "RESOLVED", index_col=False)
+thr = LazyTable(StaticTable, "THRESHOLDS", index_col=[0, 1])
+raw = LazyTable(StaticTable, "LITERATURE", index_col=False)
+cit = LazyTable(StaticTable, "CITATIONS", index_col=0, comment="\"")
+tgt = LazyTable(StaticTable, "TARGETS", index_col=0)
 
 ################################################################################
\ No newline at end of file
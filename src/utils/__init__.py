@@ -3,6 +3,9 @@ from data_init.g2pConstants import *
 from . import generalUtilities as gU
 from . import g2pUtilities as g2pU
 from . import phenosUtilities as pU
+from . import codonUtilities as cU
+from . import refUtilities as rU
+from . import alignUtilities as aU
 from . import sequencesUtilities as sU
 from . import mutationUtilities as mU
 
@@ -0,0 +1,274 @@
+"""
+In-process alignment of sequences against the domain references.
+
+The references (see rU - four domains for each HSV type) are small enough to
+align against without BWA. <align_seqs> is a NumPy alternative, for where BWA
+is not installed (it is no faster, even for a single sequence - see
+<auto_cutoff>). Each sequence is seeded with exact k-mer matches, which pick
+the reference and the diagonal. Most sequences have no indels, and are aligned
+along that diagonal in a single vectorised pass (<ungapped>). The rest are
+aligned within a band around the diagonal with affine gaps (<align>). The score
+matrix is filled a row (query base) at a time, each row vectorised over the
+band - the deletion scores, which depend on their left neighbours, are resolved
+with a running maximum rather than a loop. Query ends are soft-clipped where
+that scores better than aligning them, as per BWA. Scores mirror <bwa mem -O12>
+(match 1, mismatch 4, gap 12 + 1 per base, clip 5, ambiguous bases -1). Records
+are returned as SAM lines, as per BWA.
+"""
+
+import re
+import threading
+
+import itertools as it
+import numpy as np
+
+from . import g2pU, rU
+
+# The NumPy engine is a fallback for where bwa is not installed (or for when it
+# is forced with --aligner numpy) - with bwa installed, "auto" (see
+# sU.choose_engine) only aligns batches of up to <auto_cutoff> sequences
+# in-process, i.e. none. Best of 5 times (s) of sU.benchmark over the dev
+# FASTAs, with bwa 0.7.15 on a single CPU:
+#	SEQS	1		2		5		10		20		100		500
+#	bwa		0.012	0.011	0.048	0.045	0.108	0.505	2.845
+#	numpy	0.016	0.013	0.045	0.382	0.397	2.277	8.806
+# BWA is as fast for the smallest batches, and faster above, so in-process
+# alignment is only used where BWA is not installed
+auto_cutoff = 0
+
+k = 12
+band = 40
+match, mismatch, ambiguous = 1, -4, -1
+gap_open, gap_extend, clip = 12, 1, 5
+min_seeds = 3
+max_mismatches = 3, 20		# Mismatches per window that suggest an indel
+
+NEG = -(1 << 28)
+
+# 2-bit k-mer codes of the unambiguous bases (-1 for anything else)
+nt_codes = np.full(16, -1, dtype=np.int64)
+nt_codes[[1, 2, 4, 8]] = np.arange(4)
+
+################################################################################
+class ReferenceIndex(object):
+	"""
+	A sorted k-mer index over the encoded reference sequences (see rU). Built
+	once, on first use, and shared between threads.
+	"""
+
+	lock = threading.Lock()
+	index = None
+
+	def __init__(self):
+		self.names = [*rU.references()]
+		self.seqs = [ref.arr for ref in rU.references().values()]
+
+		kmers, refs, positions = zip(*(
+			(kmer_codes(seq), np.full(len(seq), i), np.arange(len(seq)))
+			for i, seq in enumerate(self.seqs)
+		))
+		kmers, refs, positions = map(np.concatenate, (kmers, refs, positions))
+
+		valid = kmers >= 0
+		order = np.argsort(kmers[valid], kind="stable")
+		self.kmers = kmers[valid][order]
+		self.refs, self.positions = refs[valid][order], positions[valid][order]
+
+	@classmethod
+	def get(cls):
+		"Returns the shared ReferenceIndex, building it if necessary"
+
+		with cls.lock:
+			if cls.index is None: cls.index = cls()
+		return cls.index
+
+	def seed(self, query):
+		"""
+		Returns the (reference, diagonal) with the most exact k-mer matches to
+		<query>, or None if there are fewer than <min_seeds>
+		"""
+
+		kmers = kmer_codes(query)
+		qpos = np.flatnonzero(kmers >= 0)
+		kmers = kmers[qpos]
+
+		lo = np.searchsorted(self.kmers, kmers, side="left")
+		hi = np.searchsorted(self.kmers, kmers, side="right")
+		if not (n_hits := hi - lo).sum(): return None
+
+		hits = np.concatenate([np.arange(*bounds) for bounds in zip(lo, hi)])
+		diagonals = self.positions[hits] - np.repeat(qpos, n_hits)
+		seeds, counts = np.unique(
+			np.stack((self.refs[hits], diagonals)), axis=1, return_counts=True
+		)
+
+		if counts.max() < min_seeds: return None
+		ref, diagonal = seeds[:, counts.argmax()]
+		return int(ref), int(diagonal)
+
+################################################################################
+def kmer_codes(arr):
+	"""
+	Returns the 2-bit packed code of the k-mer starting at each position of
+	encoded sequence <arr> (-1 where it runs off the end or is ambiguous)
+	"""
+
+	codes = nt_codes[arr]
+	kmers = np.full(len(arr), -1, dtype=np.int64)
+	if len(arr) < k: return kmers
+
+	windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+	packed = (windows << (2 * np.arange(k - 1, -1, -1))).sum(axis=1)
+	kmers[:len(packed)] = np.where((windows < 0).any(axis=1), -1, packed)
+	return kmers
+
+#-------------------------------------------------------------------------------
+def scores(query, ref):
+	"Scores encoded bases <query> against <ref> (elementwise, broadcast)"
+
+	single = np.isin(query, (1, 2, 4, 8))
+	return np.where(single, np.where(query & ref, match, mismatch), ambiguous)
+
+#-------------------------------------------------------------------------------
+def ungapped(query, ref, diagonal):
+	"""
+	Aligns encoded <query> to encoded <ref> along <diagonal> without gaps,
+	clipping either end where that scores better (as per <align>). Returns the
+	(0-based) reference start and CIGAR string, or None if the mismatches
+	suggest an indel (see <max_mismatches>) and a gapped alignment is needed.
+	"""
+
+	n = len(query)
+	i0, i1 = max(0, -diagonal), min(n, len(ref) - diagonal)
+	if i1 - i0 < k: return None
+
+	s = scores(query[i0:i1], ref[i0 + diagonal:i1 + diagonal])
+	count, window = max_mismatches
+	if len(s) >= window and \
+	(np.convolve(s == mismatch, np.ones(window, dtype=int), "valid") > count).any():
+		return None
+
+	# Start <p> and end <e> (within the overlap) maximising the clipped score
+	cum = np.r_[0, np.cumsum(s)]
+	p = np.argmax(-cum[:-1] - clip * ((np.arange(len(s)) + i0) > 0))
+	e = np.argmax(cum[1:] - clip * ((np.arange(1, len(s) + 1) + i0) < n)) + 1
+	if e <= p: return None
+
+	ops = ((i0 + p, "S"), (e - p, "M"), (n - i0 - e, "S"))
+	return int(i0 + p + diagonal), "".join(f"{length}{op}" for length, op in ops if length)
+
+#-------------------------------------------------------------------------------
+def align(query, ref, diagonal):
+	"""
+	Aligns encoded <query> to encoded <ref> within <band> of <diagonal> (ref
+	position - query position). The whole query is aligned, but its ends may
+	be soft-clipped. Returns the (0-based) reference start and CIGAR string,
+	or None if there is no alignment.
+	"""
+
+	n, width = len(query), 2 * band + 1
+	offsets = np.arange(width)
+	gaps = gap_extend * offsets
+
+	# Per row (query base) and band column: the source of H before deletions
+	# (0 match, 1 alignment start, 2 insertion), whether H is a deletion,
+	# whether an insertion extends another, and the column a deletion opens
+	h_src = np.zeros((n, width), dtype=np.int8)
+	is_del = np.zeros((n, width), dtype=bool)
+	i_ext = np.zeros((n, width), dtype=bool)
+	d_src = np.zeros((n, width), dtype=np.int16)
+
+	H, I = np.full(width, NEG), np.full(width, NEG)
+	best = (NEG, 0, 0)
+
+	# Scores and validity of every cell of the band, row i / ref base j
+	j = np.arange(n)[:, None] + diagonal + offsets - band
+	valids = (j >= 0) & (j < len(ref))
+	S = scores(query[:, None], ref[np.clip(j, 0, len(ref) - 1)])
+
+	for i, (s, valid) in enumerate(zip(S, valids)):
+		# Alignments start at the first query base, or at a clipped one
+		start = 0 if i == 0 else -clip
+		M = np.maximum(H, start) + s
+		src = np.where(H >= start, 0, 1)
+
+		I_open = np.append(H[1:], NEG) - gap_open - gap_extend
+		I_prev = np.append(I[1:], NEG) - gap_extend
+		I = np.maximum(I_open, I_prev)
+		i_ext[i] = I_prev > I_open
+
+		Hp = np.where(valid, np.maximum(M, I), NEG)
+		h_src[i] = np.where(I > M, 2, src)
+
+		# Deletions: D[d] = max(Hp[x] - open - extend * (d - x)) for x < d
+		t = Hp + gaps
+		running = np.maximum.accumulate(t)
+		argmax = np.maximum.accumulate(np.where(t == running, offsets, 0))
+		D = np.full(width, NEG)
+		D[1:] = running[:-1] - gap_open - gaps[1:]
+		d_src[i, 1:] = argmax[:-1]
+
+		H = np.where(valid, np.maximum(Hp, D), NEG)
+		is_del[i] = D > Hp
+		I = np.where(valid, I, NEG)
+
+		# The rest of the query is clipped, unless this is the last row
+		end = (row := H.argmax(), H[row] - clip * (i < n - 1))
+		if end[1] > best[0]: best = (end[1], i, end[0])
+
+	if best[0] <= NEG // 2: return None
+	return traceback(h_src, is_del, i_ext, d_src, *best[1:], n, diagonal)
+
+#-------------------------------------------------------------------------------
+def traceback(h_src, is_del, i_ext, d_src, i, d, n, diagonal):
+	"Returns the reference start and CIGAR of the alignment ending at <i>, <d>"
+
+	ops = ["S"] * (n - 1 - i)
+	state = "H"
+
+	while True:
+		if state == "H" and is_del[i, d]:
+			x = d_src[i, d]
+			ops.extend("D" * (d - x))
+			d, state = x, "Hp"
+		elif state == "I" or h_src[i, d] == 2:
+			ops.append("I")
+			state = "I" if i_ext[i, d] else "H"
+			i, d = i - 1, d + 1
+		else:
+			ops.append("M")
+			if h_src[i, d] == 1 or i == 0:
+				ops.extend("S" * i)
+				break
+			i, state = i - 1, "H"
+
+	start = i + diagonal + d - band
+	cigar = "".join(f"{len([*group])}{op}" for op, group in it.groupby(ops[::-1]))
+
+	return int(start), cigar
+
+#-------------------------------------------------------------------------------
+def align_seqs(df):
+	"""
+	Aligns the sequences (<SEQ>) of <df>, yielding a SAM line (as per BWA,
+	primary forward-mapped records only) for each sequence that maps
+	"""
+
+	index = ReferenceIndex.get()
+	for qname, seq in zip(df.index, df.SEQ):
+		query = rU.encode(seq)
+		if (seed := index.seed(query)) is None: continue
+
+		ref, diagonal = seed
+		aligned = ungapped(query, index.seqs[ref], diagonal) \
+				  or align(query, index.seqs[ref], diagonal)
+		if aligned is None: continue
+
+		# As per BWA, bases other than ACGT are reported (and so called) as N
+		start, cigar = aligned
+		seq = re.sub(r"[^ACGT]", "N", seq.upper())
+		yield "\t".join(map(str, (
+			qname, 0, index.names[ref], start + 1, 60, cigar, "*", 0, 0, seq, "*"
+		)))
+
+################################################################################
@@ -0,0 +1,129 @@
+"""
+Codon translation by table lookup.
+
+Bases are 4-bit masks (A1 C2 G4 T8 - see rU), so any codon, ambiguous or not,
+is one of 16^3 codon indexes (b1 << 8 | b2 << 4 | b3). <aa_masks> maps every
+codon index to the bitmask of the amino acids it can encode (bit i for
+<AAS>[i]), so that whole sequences - or stacks of same-length sequences - are
+translated in a handful of array operations. <aa_counts> and <aa_letters> hold
+the number and the letters of those amino acids, for ambiguous codons (missing
+data, mixtures and insertions). All three tables are built once, on import.
+"""
+
+import itertools as it
+import numpy as np
+
+AAS = "ACDEFGHIKLMNPQRSTVWY*"
+NTS = "ACGT"
+
+genetic_code = dict(zip(
+	map("".join, it.product("TCAG", repeat=3)),
+	"FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+))
+
+# The <AAS> index of each of the 64 unambiguous codons, by 2-bit index
+codon_aas = np.array([
+	AAS.index(genetic_code["".join(codon)]) for codon in it.product(NTS, repeat=3)
+])
+
+################################################################################
+def build_aa_masks():
+	"Returns the amino acid bitmask of each of the 16^3 4-bit codons"
+
+	# The amino acid bit of each of the 64 unambiguous codons, by 2-bit index
+	single = (1 << codon_aas).astype(np.uint32).reshape(4, 4, 4)
+
+	# Ambiguous bases are the union (OR) over the bases of their mask
+	masks = np.zeros((16, 16, 16), dtype=np.uint32)
+	bases = [[i for i in range(4) if mask >> i & 1] for mask in range(16)]
+	for b1, b2, b3 in it.product(range(16), repeat=3):
+		for n1, n2, n3 in it.product(bases[b1], bases[b2], bases[b3]):
+			masks[b1, b2, b3] |= single[n1, n2, n3]
+
+	return masks.reshape(-1)
+
+#-------------------------------------------------------------------------------
+def unpack(masks):
+	"Returns the (..., len(AAS)) boolean array of the bits set in <masks>"
+
+	bits = np.unpackbits(
+		np.ascontiguousarray(masks, dtype="<u4").view(np.uint8).reshape(*masks.shape, 4),
+		axis=-1, bitorder="little"
+	)
+	return bits[..., :len(AAS)].astype(bool)
+
+aa_masks = build_aa_masks()
+aa_counts = unpack(aa_masks).sum(axis=-1).astype(np.uint8)
+aa_letters = np.array(
+	["".join(it.compress(AAS, bits)) for bits in unpack(aa_masks)], dtype=object
+)
+
+################################################################################
+def codon_indexes(arr):
+	"""
+	Returns the codon index of each complete codon along the last axis of
+	encoded <arr> (1-D, or 2-D for a stack of sequences)
+	"""
+
+	n = arr.shape[-1] // 3 * 3
+	codons = arr[..., :n].reshape(*arr.shape[:-1], -1, 3).astype(np.intp)
+	return codons[..., 0] << 8 | codons[..., 1] << 4 | codons[..., 2]
+
+#-------------------------------------------------------------------------------
+def translate(arr):
+	"Returns the amino acid bitmasks of the codons of encoded <arr>"
+
+	return aa_masks[codon_indexes(arr)]
+
+#-------------------------------------------------------------------------------
+def count_aas(arr):
+	"Returns the number of possible amino acids of each codon of encoded <arr>"
+
+	return aa_counts[codon_indexes(arr)]
+
+#-------------------------------------------------------------------------------
+def translate_letters(arr):
+	"""
+	Returns the possible amino acids of each codon of encoded <arr> as strings
+	(in <AAS> order), e.g. for the combinations of an insertion
+	"""
+
+	return aa_letters[codon_indexes(arr)]
+
+#-------------------------------------------------------------------------------
+def call_SNPs(arr, ref_aa):
+	"""
+	Returns, for each sequence in <arr> (encoded, 1-D or a 2-D stack aligned
+	to the same reference), the non-wt amino acids at each locus as HGVS
+	strings (p.X123Y), in locus then <AAS> order. <ref_aa> are the amino acid
+	bitmasks of the reference (see <translate>).
+	"""
+
+	alt = np.atleast_2d(translate(arr))
+	n = min(alt.shape[-1], len(ref_aa))
+	alt = alt[:, :n] & ~ref_aa[:n]
+
+	rows, loci, aas = np.nonzero(unpack(alt))
+	ref = np.array([*AAS])[unpack(ref_aa[:n]).argmax(axis=-1)]
+
+	SNPs = [[] for _ in range(len(alt))]
+	for row, locus, aa in zip(rows, loci, aas):
+		SNPs[row].append(f"p.{ref[locus]}{locus + 1}{AAS[aa]}")
+
+	return SNPs if np.ndim(arr) > 1 else SNPs[0]
+
+#-------------------------------------------------------------------------------
+def aa_freqs(freqs):
+	"""
+	Returns the frequency of each amino acid (in <AAS> order) at each complete
+	codon of per-base frequencies <freqs> (a row per base, in <NTS> order) -
+	taking the bases of a codon as independent, e.g. for NGS base counts
+	"""
+
+	n = len(freqs) // 3
+	f = freqs[:n * 3].reshape(n, 3, 4)
+	codons = np.einsum("ni,nj,nk->nijk", f[:, 0], f[:, 1], f[:, 2]).reshape(n, 64)
+
+	return codons @ np.eye(len(AAS))[codon_aas]
+
+################################################################################
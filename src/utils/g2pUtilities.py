@@ -1,21 +1,42 @@
+import argparse
+import hashlib
 import logging
+import multiprocessing
 import os
 import re
+import time
+import zlib
 
 import itertools as it
 import numpy as np
 import pandas as pd
 
+from concurrent.futures import (
+	FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from contextlib import contextmanager
+from datetime import datetime as dt
+from functools import partial
+from glob import glob
+
 from . import gU
+from data_init import g2pCache as g2pC
+from data_init import g2pHGVS as g2pH
+from data_init import g2pHomology as g2pHom
 from data_init.g2pConstants import *
+from data_init import g2pTables as g2pT
 from data_init.g2pTables import *
 
+# Worker processes for row-wise analysis (see <row_executor>) - set per workflow
+# from the command line
+procs = analysis_procs
+
+# The (i, N) shard of the input files handled by this process (see <set_shard>)
+shard = None
+
 ################################################################################
 "SHORT FUNCTIONS"
 
-hgvs_regex = re.compile(r"([12]v?)\.(\w+)\.([pcm])\.([A-Z]?)" \
-						r"(\d{1,4}(?:-\d{1,4})?).*?([A-Z\*]|ins[A-Z]+|del)?")
-
 def group_format(loci):
 	"String formatting for start/end loci"
 	start, end = loci
@@ -26,21 +47,153 @@ def find_input_files(args, regex):
 
 	if args.single_file: return [os.path.abspath(args.single_file)]
 
+	directory = os.path.abspath(args.directory)
+	paths = sorted(scan_files(directory, regex, recursive=args.recursive))
+	return in_shard(paths, directory)
+
+def parse_shard(value):
+	"Parses shard <value> i/N (1 <= i <= N) as (i, N), for argparse"
+
+	if not (match := re.fullmatch(r"(\d+)/(\d+)", value)) \
+	or not 1 <= (i := int(match[1])) <= (n := int(match[2])):
+		raise argparse.ArgumentTypeError(f"Shard must be i/N, with 1 <= i <= N: {value}")
+	return i, n
+
+def set_shard(value):
+	"""
+	Makes this process shard <value> (i, N) of a sharded run - handling only
+	its share of the input files (see <in_shard>), with DynamicTables and
+	import runs of its own under <shard_dir>/{i}of{N}, for MERGE to fold into
+	the main Tables. The variant call cache is not used, as the shards of a run
+	would all be writing to it over the shared filesystem.
+	"""
+
+	global shard
+
+	shard = value
+	root = f"{shard_dir}/{value[0]}of{value[1]}"
+	g2pT.set_dynamic_root(root)
+	ImportRun.location = f"{root}/dynamic/runs"
+	g2pC.cache.size = 0
+	log.info(f"Shard {value[0]} of {value[1]} - results in {root}")
+
+def in_shard(paths, directory):
+	"""
+	Returns the <paths> in this process' <shard> (all if unsharded). Files are
+	assigned by the CRC32 of their path relative to <directory>, so that every
+	shard of a run, on any node, partitions the same files the same way.
+	"""
+
+	if shard is None: return paths
+
+	i, n = shard
+	return [
+		path for path in paths
+		if zlib.crc32(os.path.relpath(path, directory).encode()) % n == i - 1
+	]
+
+def scan_files(directory, regex, recursive=False, threads=scan_threads):
+	"""
+	Yields the paths of files in <directory> with names matching <regex>, as
+	they are found - and, if <recursive>, in all its subdirectories (at any
+	depth), sibling directories being scanned concurrently in <threads>
+	threads. Each directory costs a single os.scandir, as the entries carry
+	their type. Linked directories are followed, and every directory is
+	scanned only once, however it is reached (by its real path).
+	"""
+
 	regex = re.compile(regex)
-	paths = [os.path.abspath(args.directory)]
-
-	if args.recursive:
-		isdir = lambda d: os.path.isdir(os.path.join(paths[0], d))
-		paths.extend([
-			os.path.join(paths[0], subdirectory)
-			for subdirectory in filter(isdir, os.listdir(paths[0]))
-		])
-
-	return sorted(
-		os.path.join(d, f)
-		for d in paths
-		for f in filter(regex.search, os.listdir(d))
-	)
+
+	def scan(d):
+		files, dirs, links = [], [], []
+		try:
+			with os.scandir(d) as entries:
+				for entry in entries:
+					if entry.is_dir():
+						(links if entry.is_symlink() else dirs).append(entry.path)
+					elif regex.search(entry.name):
+						files.append(entry.path)
+		except OSError as e:
+			log.warning(f"Could not scan {d}: {e}")
+		return files, dirs, links
+
+	seen = {os.path.realpath(directory)}
+	with ThreadPoolExecutor(threads) as pool:
+		pending = {pool.submit(scan, directory)}
+		while pending:
+			done, pending = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				files, dirs, links = future.result()
+				yield from files
+				if not recursive: continue
+
+				for d in (*dirs, *map(os.path.realpath, links)):
+					if (real := os.path.realpath(d)) in seen: continue
+					seen.add(real)
+					pending.add(pool.submit(scan, d))
+
+def filter_manifest(paths, force=False):
+	"""
+	Returns MANIFEST rows (PATH, SIZE, MTIME, HASH) for those of <paths> that
+	are new or changed since they were last recorded (all of them if <force>),
+	with <CHANGED> flagging those recorded before. An unchanged file costs a
+	single stat - only files whose size or mtime differ are hashed, and those
+	with unchanged content are simply re-recorded. The rows are recorded with
+	<record_manifest> once imported.
+	"""
+
+	known = dict(zip(man.df.PATH, zip(man.df.SIZE, man.df.MTIME, man.df.HASH)))
+	rows, touched = [], []
+
+	for path in paths:
+		stat = os.stat(path)
+		row = [path, stat.st_size, stat.st_mtime]
+		if (record := known.get(path)) and not force \
+		and (record[0], record[1]) == (row[1], row[2]):
+			continue
+
+		row += [file_hash(path), record is not None]
+		if record and not force and record[2] == row[3]: touched.append(row)
+		else: rows.append(row)
+
+	cols = [*man.cols, "CHANGED"]
+	if touched: record_manifest(pd.DataFrame(touched, columns=cols))
+	return pd.DataFrame(rows, columns=cols)
+
+def file_hash(path):
+	"Returns the SHA-1 of the contents of file <path>"
+
+	sha1 = hashlib.sha1()
+	with open(path, "rb") as f:
+		while (block := f.read(1 << 20)): sha1.update(block)
+	return sha1.hexdigest()
+
+def record_manifest(df):
+	"Records MANIFEST rows <df>, replacing any earlier rows for their PATHs"
+
+	if df is None or df.empty: return
+	if len(indexes := man.df.index[man.df.PATH.isin(df.PATH)]): man.delete(indexes)
+	man.append(df[man.cols])
+	man.write()
+
+def remove_changed(table, manifest):
+	"Deletes the entries of <table> (and their children) for changed files"
+
+	paths = table.df.LOCATION.astype(str).str.cat(table.df.FILENAME.astype(str), sep=os.sep)
+	if len(indexes := table.df.index[paths.isin(manifest.PATH[manifest.CHANGED])]):
+		log.info(f"Removing {len(indexes)} changed file(s) and their data")
+		table.delete(indexes)
+
+def watch(func, interval):
+	"Calls <func> every <interval> seconds, until interrupted"
+
+	log.info(f"*-- Watching for new files every {interval}s (Ctrl-C to stop) --*")
+	try:
+		while True:
+			func()
+			time.sleep(interval)
+	except KeyboardInterrupt:
+		log.info("*-- Stopped watching --*")
 
 def move_to_archive(df, prefix):
 	"Moves new files to the archive data store (<g2pU.data_dir>/archive)"
@@ -90,34 +243,173 @@ log = getLog("g2pU", fileLog=False)
 ################################################################################
 "PHENOS and SEQUENCES process"
 
-def analyse_data(src_df, table, func, datatype):
+def analyse_data(src_df, table, func, datatype, init=None):
 	"""
 	Takes data prepared from one Table and processes it for import into a child
 	Table. Returns that part of the child Table containing data from the input.
+	Rows are processed by <row_executor> (worker processes set up by <init>).
 	"""
-	print(src_df)
+
 	if (tmp_df := src_df[~src_df.index.isin(table.df.PARENT_ID)]).empty:
 		log.info(f"No new {datatype} analysis required")
 
 	else:
-		input(tmp_df)
 		log.info(f"*-- Analysing {len(tmp_df)} {datatype}s --*")
 
-		if table is var: tmp_df = sU.map_fasta_seqs(tmp_df)
-		tmp_df = pd.concat(gU.threaded(func, tmp_df.iterrows(), 16))
-		table.append(tmp_df)
+		# (imported here, as sU itself imports this module)
+		from . import sequencesUtilities as sU
+
+		# Sequences called before (by the same mapping engine) are taken from
+		# the cache (see g2pCache), and the rest mapped - arriving in chunks,
+		# each analysed and appended (and its calls cached) as it is received
+		seq_df, engine = tmp_df, None
+		if table is var:
+			engine = sU.choose_engine(len(tmp_df))
+			cached, seq_df = g2pC.cache.lookup(tmp_df, engine)
+			log.info(f"{len(tmp_df) - len(seq_df)} {datatype}s found in the cache")
+			if not cached.empty: table.append(cached)
+
+		chunks = sU.map_fasta_seqs(seq_df, engine) if table is var else [seq_df]
+		unmapped = seq_df.index
+		with row_executor(init) as run:
+			for chunk in chunks:
+				unmapped = unmapped.difference(chunk.index)
+				if chunk.empty or not (dfs := run(func, chunk)): continue
+				table.append(df := pd.concat(dfs))
+				if table is var: g2pC.cache.store(seq_df.loc[chunk.index], df, engine)
+
+		# Sequences that did not map are cached too, without variants
+		if table is var:
+			empty = pd.DataFrame(columns=table.cols)
+			g2pC.cache.store(seq_df.loc[unmapped], empty, engine)
+			g2pC.cache.flush()
 		table.write()
 
 		log.info(f"*-- Analysis of {datatype}s complete --*")
 
 	return table.filter(("PARENT_ID", src_df.index))
 
+#-------------------------------------------------------------------------------
+@contextmanager
+def row_executor(init=None):
+	"""
+	Yields a function applying <func> to each row of a DataFrame and returning
+	a list of the resulting DataFrames - in threads, or if <procs>, split into
+	one chunk per worker process, each worker set up once by <init> (e.g. to
+	load reference data) and returning one concatenated DataFrame per chunk.
+	Workers are started by a fork server, not forked from this process, so
+	that they inherit none of its open pipes (e.g. BWA's stdin, see
+	sU.stream_bwa) or threads.
+	"""
+
+	if not procs:
+		yield lambda func, df: gU.threaded(func, df.iterrows(), 16)
+		return
+
+	with ProcessPoolExecutor(
+		procs, mp_context=multiprocessing.get_context("forkserver"),
+		initializer=start_worker, initargs=(g2pT.dynamic_root, init)
+	) as pool:
+
+		def run(func, df):
+			size = -(-len(df) // procs)
+			chunks = [df.iloc[i:i + size] for i in range(0, len(df), size)]
+			return [*pool.map(partial(apply_rows, func), chunks)]
+
+		yield run
+
+#-------------------------------------------------------------------------------
+def start_worker(root, init=None):
+	"Sets up a worker process with the data <root> of its parent, then <init>"
+
+	if root != g2pT.dynamic_root: g2pT.set_dynamic_root(root)
+	if init: init()
+
+#-------------------------------------------------------------------------------
+def apply_rows(func, df):
+	"Applies <func> to each row of <df> (in a worker), as one DataFrame"
+
+	return pd.concat([func(index, row) for index, row in df.iterrows()])
+
 ################################################################################
 "REPORTS"
 
 ################################################################################
 "CLASSES"
 
+class ImportRun(object):
+	"""
+	The manifest of an import run (<location>/<name>.tsv), logging each stage
+	(<stages>) as it is completed for each input file, so that a failed run can
+	be resumed (<resume>) by redoing only the files not yet complete (see
+	<unfinished>) - any stages already committed for those being skipped by
+	the de-duplication of the Tables themselves. With SQL-backed Tables, each
+	batch is a single transaction, so its stages are only written to the
+	manifest once it commits (<commit>). Runs are kept in the class <location>
+	(see <set_shard>), unless given another.
+	"""
+
+	stages = ("FOUND", "FILES", "FASTAS", "VARIANTS")
+	location = f"{data_dir}/dynamic/runs"
+
+	def __init__(self, name=None, location=None):
+		self.name = name or dt.now().strftime("%Y%m%d_%H%M%S")
+		self.location = location or self.location
+		self.fname = f"{self.location}/{self.name}.tsv"
+		self.deferred = Dynamic is SQLTable
+		self.pending = []
+
+	def __repr__(self):
+		return f"ImportRun({self.name})"
+
+	@classmethod
+	def resume(cls, name="latest", location=None):
+		"""
+		Returns the ImportRun <name> (in <location>) - the most recent if <name>
+		is latest
+		"""
+
+		location = location or cls.location
+		if name == "latest":
+			fnames = sorted(glob(f"{location}/*.tsv"), key=os.path.getmtime)
+			if not fnames: raise FileNotFoundError(f"No import runs in {location}")
+			name = os.path.splitext(os.path.basename(fnames[-1]))[0]
+
+		if not os.path.exists((run := cls(name, location)).fname):
+			raise FileNotFoundError(f"No import run {run.fname}")
+		return run
+
+	def log(self, paths, stage):
+		"Logs <stage> as complete for <paths> (on <commit>, if deferred)"
+
+		self.pending.extend((path, stage) for path in paths)
+		if not self.deferred: self.commit()
+
+	def commit(self):
+		"Appends the logged stages to the manifest"
+
+		if not self.pending: return
+
+		os.makedirs(self.location, exist_ok=True)
+		pd.DataFrame(self.pending, columns=["PATH", "STAGE"]).to_csv(
+			self.fname, sep="\t", index=False, mode="a",
+			header=not os.path.exists(self.fname)
+		)
+		self.pending = []
+
+	def progress(self):
+		"Returns the last stage completed for each input file (by PATH)"
+
+		df = pd.read_csv(self.fname, sep="\t", dtype=str)
+		df["STAGE"] = pd.Categorical(df.STAGE, categories=self.stages, ordered=True)
+		return df.groupby("PATH", sort=False, observed=True).STAGE.max()
+
+	def unfinished(self):
+		"Returns the input files not yet complete, in the order they were found"
+
+		progress = self.progress()
+		return [*progress.index[progress != self.stages[-1]]]
+
 #@gU.memo
 class HGVS(object):
 	"""
@@ -128,9 +420,9 @@ class HGVS(object):
 
 	def __init__(self, hgvs):
 		self.hgvs = hgvs
-		if not (match := hgvs_regex.search(self.hgvs)):
+		if not (parsed := g2pH.parse_HGVS(self.hgvs)):
 			raise ValueError("Not in proper HGVS format (see docs)")
-		self.h, self.d, self.p, self.r, self.l, self.a = match.groups()
+		self.h, self.d, self.p, self.r, self.l, self.a = parsed
 
 	def __repr__(self):
 		return self.hgvs
@@ -176,8 +468,6 @@ class Mutation(HGVS):
 		self.pc = "c" if self.p == "c" else "p"
 		if not self.a is None: return [self.hgvs]
 
-
-
 		self.l2 = self.l.split("-")[-1]
 		self.l, self.l2 = map(int, (self.l, self.l2))
 
@@ -185,45 +475,30 @@ class Mutation(HGVS):
 		if self.homology:
 			params.append((3 - int(self.h[0]), *self.get_homologous_loci()))
 
-		print("params:", params)
-
-		hits = list(gU.chain(it.starmap(self.get_potential_muts, params)))
-		print("HITS:", hits)
-		input(f"self.a is None - HGVS={self.hgvs}")
-		return hits
+		return list(gU.chain(it.starmap(self.get_potential_muts, params)))
 
 	def get_potential_muts(self, h, l, l2):
-
-		loci = "|".join(map(str, range(l-self.extend, l2+self.extend+1)))
-		hits_regex = f"{h}v?\.{self.d}\.{self.pc}\.[A-Z]?({loci})[idA-Z\*]"
-
-		print(f"h: {h}, l: {l}, l2: {l2}")
-		print("hits_regex:",hits_regex)
+		"""
+		Returns the known variants (in <var> and <lit>) of HSV type <h> at loci
+		<l>..<l2>, extended by <extend> either side, in locus order. Loci are
+		looked up in the LocusIndex of each Table (see g2pHGVS).
+		"""
 
 		def filter_table(table):
-			ser = table.df.HGVS.str.extract(hits_regex).dropna()
-			df = table.df.join(ser, how="right")
-			return df
+			positions = table.loci.find(
+				h, self.d, self.pc, l - self.extend, l2 + self.extend
+			)
+			return pd.DataFrame({
+				"HGVS": table.df.HGVS.to_numpy()[positions],
+				"LOCUS": table.hgvs["start"][positions]
+			})
 
 		df = pd.concat(map(filter_table, (var, lit)))
-		print(df)
-		hits = pd.unique(df.sort_values(0).HGVS)
-
-		input(hits)
-
-		return hits
+		return pd.unique(df.sort_values("LOCUS", kind="stable").HGVS)
 
 	def get_homologous_loci(self):
+		"The loci in the other HSV type homologous to <l>..<l2> (see g2pHomology)"
 
-		aln = f"{data_dir}/static/{self.d}.{self.pc}.aln"
-		fastas = sorted([*gU.fasta_parser(aln)], key=lambda x: x[0] == self.h)
-		is_base = np.stack([
-			np.cumsum([*map(lambda x: x != "-", fasta[1])])
-			for fasta in fastas
-		])
-
-		func = lambda x: np.where(is_base[-1]==x)[0][0]
-
-		return is_base[0][[*map(func, (self.l, self.l2))]]
+		return g2pHom.homologous_loci(self.d, self.pc, self.h, (self.l, self.l2))
 
 ################################################################################
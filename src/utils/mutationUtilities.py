@@ -9,6 +9,8 @@ import pandas as pd
 from functools import partial, reduce
 
 from . import gU, g2pU
+from data_init import g2pHGVS as g2pH
+from data_init import g2pHomology as g2pHom
 
 ################################################################################
 class Mutation():
@@ -20,9 +22,6 @@ class Mutation():
 	submitted <hgvs> and <homology> arguments.
 	"""
 
-	regex = r"([12]v?)\.(\w+)\.([pcm])\.([A-Z]?)" \
-			r"(\d{1,4}(?:-\d{1,4})?).*?([A-Z]|ins|del)?"
-
 	def __init__(self, hgvs, homology, lookaround):
 		self.hgvs = hgvs
 		self.homology = homology
@@ -34,8 +33,8 @@ class Mutation():
 	def get_mutations(self):
 		"Takes the raw HGVS and processes for range, missing data, and homology"
 
-		if not (match := re.search(Mutation.regex, self.hgvs)): return []
-		self.h, self.d, self.p, self.r, self.l, self.a = match.groups()
+		if not (parsed := g2pH.parse_HGVS(self.hgvs)): return []
+		self.h, self.d, self.p, self.r, self.l, self.a = parsed
 		self.l2 = self.l.split("-")[-1]
 
 		if self.p == "m": self.missing()
@@ -47,20 +46,22 @@ class Mutation():
 
 
 	def add_homology(self):
-		aln = f"{data_dir}/static/{self.domain}.{self.pc}.aln"
-
-		fastas = sorted([*gU.fasta_parser(aln)], key=lambda x: x[0] == self.hsvtype)
-		ref_seq = fastas.pop()[1]
-		pos = np.where([*map(lambda x: x != "-", ref_seq)])[0][args.locus]
-		self.homolog = get_homolog(pos)
-		def get_homolog(pos):
-			if self.ref and ref_seq[:pos][-1] != self.ref: return
-			hsvtype = str(3 - int(self.hsvtype[0]))
-			mut = "".join((self.ref, str(pos), self.alt))
-			return Mutation(".".join((hsvtype, self.domain, self.pcm, mut)))
-
-		def func(n, s): return (n, (s := s[:pos])[-1], len(s.replace("-", "")))
-		return [*it.starmap(func, fastas)]
+		"""
+		Sets <homolog>, the Mutation at the homologous loci in the other HSV
+		type (see g2pHomology). The ref residue(s) are dropped, as they need not
+		be conserved.
+		"""
+
+		pc = "c" if self.p == "c" else "p"
+		loci = g2pHom.homologous_loci(self.d, pc, self.h, [*map(int, (self.l.split("-")[0], self.l2))])
+		loci = "_".join(map(str, sorted(set(loci))))
+
+		hsvtype = str(3 - int(self.h[0]))
+		mut = f"{loci}{self.a or ''}"
+		self.homolog = Mutation(
+			".".join((hsvtype, self.d, self.p, mut)), self.homology, self.lookaround
+		)
+		return self.homolog
 
 ################################################################################
 
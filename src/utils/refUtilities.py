@@ -0,0 +1,106 @@
+"""
+The domain reference sequences, loaded once per process.
+
+<data_dir>/static/ref_seqs.fas holds one reference per domain and HSV type,
+named as per the RNAMEs of the mapped sequences (e.g. HSV-1_TK). On first use,
+every reference is encoded into the 4-bit base masks used throughout (as per
+<gU.seq2arr> - A1 C2 G4 T8, N 15, gap 0), translated, and held as a read-only
+Reference, so that each mapped sequence only costs a dict lookup (<get>).
+"""
+
+import threading
+
+import numpy as np
+
+from . import gU, g2pU, cU
+
+fname = f"{g2pU.data_dir}/static/ref_seqs.fas"
+refs = None
+lock = threading.Lock()
+
+# 4-bit base masks of the IUPAC codes - A1 C2 G4 T8, 0 for anything else
+nt_masks = np.zeros(256, dtype=np.uint8)
+for nts, mask in zip(
+	("A", "C", "G", "T", "M", "R", "W", "S", "Y", "K", "V", "H", "D", "B", "N"),
+	(1, 2, 4, 8, 3, 5, 9, 6, 10, 12, 7, 11, 13, 14, 15)
+):
+	nt_masks[[ord(nts), ord(nts.lower())]] = mask
+nt_masks[ord("U")] = nt_masks[ord("u")] = 8
+
+################################################################################
+class Reference(object):
+	"""
+	A single encoded reference. <arr> is the (read-only) encoded sequence,
+	<aa> its translation (amino acid bitmasks, see cU), and <codons> the start
+	of each complete codon in <arr>. <hsv> and <domain> are parsed from <name>.
+	Repeat run lengths (see <runs>) are computed once per indel length.
+	"""
+
+	def __init__(self, name, seq):
+		self.name = name
+		self.hsv, self.domain = name.split("-", 1)[-1].split("_")[:2]
+		self.seq = seq
+		self.arr = encode(seq)
+		self.arr.setflags(write=False)
+		self.codons = np.arange(0, len(self.arr) - 2, 3)
+		self.aa = cU.translate(self.arr)
+		self._runs = {}
+
+	def __repr__(self):
+		return f"Reference({self.name}, {len(self.arr)} nt)"
+
+	def __len__(self):
+		return len(self.arr)
+
+	def runs(self, period):
+		"Returns the <repeat_runs> of <arr> for <period>-long indels"
+
+		if (runs := self._runs.get(period)) is None:
+			runs = self._runs.setdefault(period, repeat_runs(self.arr, period))
+		return runs
+
+################################################################################
+def encode(seq):
+	"Encodes string <seq> as an array of 4-bit base masks"
+
+	return nt_masks[np.frombuffer(seq.encode(), dtype=np.uint8)]
+
+#-------------------------------------------------------------------------------
+def repeat_runs(arr, period):
+	"""
+	Returns, for each position of <arr>, the number of consecutive positions
+	from there matching the base <period> further on - i.e. how far 3' an indel
+	of <period> bases starting there can be shifted without changing the
+	sequence (homopolymers for <period> 1, tandem repeats otherwise)
+	"""
+
+	same = arr[:-period] == arr[period:]
+	positions = np.arange(len(same))
+	ends = np.minimum.accumulate(np.where(same, len(same), positions)[::-1])[::-1]
+
+	runs = np.zeros(len(arr), dtype=int)
+	runs[:len(same)] = ends - positions
+	return runs
+
+#-------------------------------------------------------------------------------
+def references():
+	"Returns the dict of name -> Reference, loading <fname> if necessary"
+
+	global refs
+
+	with lock:
+		if refs is None:
+			refs = {
+				name: Reference(name, seq.upper())
+				for name, seq in gU.fasta_parser(fname)
+			}
+
+	return refs
+
+#-------------------------------------------------------------------------------
+def get(name):
+	"Returns Reference <name>"
+
+	return references()[name]
+
+################################################################################
@@ -1,57 +1,215 @@
 """Functions that do the heavy lifting for the SEQUENCES module"""
 
+import contextlib
+import csv
+import io
 import os
+import re
+import shutil
+import tempfile
+import threading
+import time
 
 import itertools as it
 import numpy as np
 import operator as op
 import pandas as pd
+import subprocess as sp
 
 from functools import partial, reduce
 
-from . import gU, g2pU
+from . import gU, g2pU, aU, cU, rU
+from data_init import g2pHGVS as g2pH
+
+# Set from the command line by SEQUENCES: the mapping engine ("auto", "bwa" or
+# "numpy" - see <choose_engine>) and BWA threads. Also SAM records per chunk
+aligner = "auto"
+threads = g2pU.bwa_threads
+chunksize = 1000
+
+# The SAM fields needed for variant calling, and the per-base codes of the
+# CIGAR operations, as per <gU.cigar2arr> (-1 for those consuming neither the
+# sequence nor the reference, which are dropped)
+sam_fields = {"QNAME": 0, "RNAME": 2, "POS": 3, "CIGAR": 5, "SEQ": 9}
+sam_dtypes = {"QNAME": int, "RNAME": "category", "POS": np.int32, "CIGAR": str, "SEQ": str}
+cigar_codes = {"M": 0, "=": 0, "X": 0, "D": 1, "N": 1, "S": 4, "I": 8, "H": -1, "P": -1}
+
+# QuasiBAM base frequency tables (tab-separated, a row per reference position)
+# - their columns, as renamed on reading. RNAME is the reference (e.g. HSV-1_TK),
+# POS the position on it, and A, C, G, T and DEL (optional) the reads of each
+# base or of a deletion there (as counts or percentages, either will do)
+ngs_cols = {
+	"Reference": "RNAME", "Position": "POS", "A": "A", "C": "C", "G": "G", "T": "T",
+	"Del": "DEL"
+}
+ngs_chunksize = 100000
+
+# The MOLIS numbers that name the samples imported, and the IUPAC code of each
+# 4-bit base mask (see rU)
+MOLIS_regex = r"([Hh]\d{9}|RS\d{8})"
+iupac = np.array([*"-ACMGRSVTWYHKDBN"])
 
 ################################################################################
-def parse_FASTA(index, row):
+def iter_FASTA(path):
+	"Yields the records of FASTA <path> as (NAME, SEQ), one at a time"
 
-	path = os.path.join(row.LOCATION, row.FILENAME)
-	if (df := gU.fas2df(path)).empty: return pd.DataFrame()
+	for name, seq in gU.fasta_parser(path): yield name, seq
 
-	df["SEQ"] = df.SEQ.str.replace("-", "")
-	df["MOLIS"] = df.NAME.apply(gU.MOLIS_name, spaces=True)
-	df["PARENT_ID"] = index
-	df = df[df.MOLIS.str.match(r"([Hh]\d{9}|RS\d{8})")]
+#-------------------------------------------------------------------------------
+def parse_FASTA(df):
+	"""
+	Takes FASTA records <df> (NAME, SEQ), returning those named with a MOLIS
+	number, with their MOLIS and gaps removed from their sequences
+	"""
 
-	return df
+	df = df.assign(
+		SEQ=df.SEQ.str.replace("-", ""),
+		MOLIS=df.NAME.apply(gU.MOLIS_name, spaces=True).astype(str)
+	)
+	return df[df.MOLIS.str.match(MOLIS_regex)]
 
 ################################################################################
-def map_fasta_seqs(df):
+def map_fasta_seqs(df, engine=None):
+	"""
+	Maps sequences against the references with <engine> (see <choose_engine>
+	by default) and yields the SAM as <df> chunks of up to <chunksize> records,
+	as the records are produced
+	"""
 
-	"BWA maps sequences against the reference index and returns SAM as a <df>"
+	if df.empty: return
+	lines = sam_lines(df, engine)
 
-	if df.empty: return pd.DataFrame()
-	tmp = gU.df2fas(df.reset_index(), "tmp.fas", cols=["index", "SEQ"])
+	while (chunk := [*it.islice(lines, chunksize)]):
+		yield read_sam(chunk)
 
-	pc = gU.bwa_mem("-t1", "-O12", target=f"{g2pU.data_dir}/static/bwa", fastq=tmp)
-	pc = gU.samtools("view", F=8191, stdin=pc.stdout).communicate()[0]
-	gU.remove(tmp)
+#-------------------------------------------------------------------------------
+def read_sam(lines):
+	"""
+	Reads SAM <lines> straight into typed columns (<sam_fields> only), indexed
+	by QNAME, with categorical HSV and DOMAIN (from RNAME) and the expanded
+	CIGAR of each record (<C_ARR>, see <expand_cigars>)
+	"""
 
-	df = pd.DataFrame(map(gU.get_sam_line, pc.strip().split("\n")))
-	if df.empty: return df
+	df = pd.read_csv(
+		io.StringIO("\n".join(lines)), sep="\t", header=None, quoting=csv.QUOTE_NONE,
+		usecols=[*sam_fields.values()], names=[*sam_fields], dtype=sam_dtypes
+	).set_index("QNAME")
 
-	func = lambda x: str(x.RNAME).split("-")[1].split("_")
-	df[["HSV", "DOMAIN"]] = df.apply(func, axis=1, result_type="expand")
-	df = df.drop(["FLAG", "MAPQ", "RNEXT", "PNEXT", "TLEN", "QUAL"], axis=1)
-	df = df.set_index("QNAME")
-	df.index = df.index.astype(int)
+	df[["HSV", "DOMAIN"]] = df.RNAME.str.extract(r"-([^_]+)_([^_]+)").astype("category")
+	df["C_ARR"] = pd.Series(expand_cigars(df.CIGAR), index=df.index, dtype=object)
 
 	return df
 
+#-------------------------------------------------------------------------------
+def expand_cigars(cigars):
+	"""
+	Expands all <cigars> into per-base operation codes (see <cigar_codes>) in
+	a single pass, and returns one array per CIGAR
+	"""
+
+	ops = np.array(re.findall(r"(\d+)([MIDNSHP=X])", "".join(cigars)))
+	if not len(ops): return [np.array([], dtype=np.int8)] * len(cigars)
+
+	lengths = ops[:, 0].astype(int)
+	codes = pd.Series(ops[:, 1]).map(cigar_codes).to_numpy(dtype=np.int8)
+	lengths[codes < 0] = 0
+
+	records = np.repeat(np.arange(len(cigars)), cigars.str.count(r"[MIDNSHP=X]"))
+	bases = np.bincount(records, weights=lengths, minlength=len(cigars)).astype(int)
+
+	return np.split(np.repeat(codes, lengths), np.cumsum(bases)[:-1])
+
+#-------------------------------------------------------------------------------
+def choose_engine(n):
+	"""
+	Returns the mapping engine for a batch of <n> sequences - <aligner>, unless
+	"auto", in which case in-process alignment (aU) is used for batches of up
+	to <aU.auto_cutoff> sequences, and BWA above. Without BWA, "auto" falls
+	back to in-process alignment, with a warning.
+	"""
+
+	if aligner != "auto": return aligner
+	if shutil.which("bwa") is None:
+		g2pU.log.warning("BWA not found - aligning in-process instead (see aU)")
+		return "numpy"
+
+	return "numpy" if n <= aU.auto_cutoff else "bwa"
+
+#-------------------------------------------------------------------------------
+def sam_lines(df, engine=None):
+	"Yields the SAM lines of <df> from <engine> (see <choose_engine> by default)"
+
+	if (engine := engine or choose_engine(len(df))) == "bwa": return stream_bwa(df)
+	return aU.align_seqs(df)
+
+#-------------------------------------------------------------------------------
+def benchmark(df, sizes=(1, 5, 20, 100, 500), repeat=3):
+	"""
+	Times both mapping engines over batches of <sizes> sequences drawn from
+	<df>, and returns the best of <repeat> times (s) per batch, for choosing
+	<aU.auto_cutoff>
+	"""
+
+	def time_engine(size, engine):
+		batch = df.sample(size, replace=len(df) < size, random_state=size)
+		times = []
+		for _ in range(repeat):
+			start = time.perf_counter()
+			[*sam_lines(batch, engine)]
+			times.append(time.perf_counter() - start)
+		return min(times)
+
+	engines = ("bwa", "numpy") if shutil.which("bwa") else ("numpy", )
+	return pd.DataFrame(
+		[[time_engine(size, engine) for engine in engines] for size in sizes],
+		index=pd.Index(sizes, name="SEQS"), columns=engines
+	)
+
+#-------------------------------------------------------------------------------
+def stream_bwa(df):
+	"""
+	Pipes the sequences of <df> into <bwa mem> (using <threads> threads) from a
+	writer thread, and yields its SAM lines as they arrive. As per <samtools
+	view -F 8191>, only primary, forward-mapped records are kept. BWA's stderr
+	is kept in a temporary file, and logged should it fail.
+	"""
+
+	cmd = [
+		"bwa", "mem", f"-t{threads}", "-O12", f"{g2pU.data_dir}/static/bwa", "-"
+	]
+
+	with tempfile.TemporaryFile("w+") as stderr:
+		with sp.Popen(cmd, stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr,
+					  text=True) as pc:
+
+			def feed():
+				try:
+					for index, seq in zip(df.index, df.SEQ):
+						pc.stdin.write(f">{index}\n{seq}\n")
+				except BrokenPipeError: pass
+				finally:
+					with contextlib.suppress(BrokenPipeError): pc.stdin.close()
+
+			(writer := threading.Thread(target=feed, daemon=True)).start()
+
+			for line in pc.stdout:
+				if line.startswith("@"): continue
+				if int(line.split("\t", 2)[1]) & 8191: continue
+				yield line.rstrip("\n")
+
+			writer.join()
+
+		if pc.returncode:
+			stderr.seek(0)
+			g2pU.log.error(f"{' '.join(cmd)} failed:\n{stderr.read().rstrip()}")
+			raise sp.CalledProcessError(pc.returncode, cmd)
+
 ################################################################################
 def parse_variants(index, row):
 
-	r_arr = gU.get_seq(row.RNAME, f"{g2pU.data_dir}/static/ref_seqs.fas")
-	c_arr = gU.cigar2arr(row.CIGAR)
+	ref = rU.get(row.RNAME)
+	r_arr = ref.arr
+	c_arr = row.C_ARR
 	p_arr = np.full_like(c_arr, int(row.POS) - 1, dtype=np.int32)
 	p_arr += np.cumsum((c_arr != 8))
 	p_arr -= (c_arr != 4).nonzero()[0][0]
@@ -67,8 +225,8 @@ def parse_variants(index, row):
 	############
 
 	arr, missing = get_missing(arr)
-	arr, indels = get_indels(arr, c_arr, s_arr)
-	SNPs = get_SNPs(arr)
+	arr, indels = get_indels(arr, c_arr, s_arr, ref)
+	SNPs = get_SNPs(arr, ref)
 
 	variants = [*gU.chain((missing, indels, SNPs))]
 	if not variants: variants = [f"{row.HSV}.None"]
@@ -81,6 +239,12 @@ def parse_variants(index, row):
 
 	return df
 
+#-------------------------------------------------------------------------------
+def init_worker():
+	"Loads the references once per worker process (see <g2pU.row_executor>)"
+
+	rU.references()
+
 #-------------------------------------------------------------------------------
 def get_missing(arr):
 	"""
@@ -96,27 +260,26 @@ def get_missing(arr):
 
 	############
 
-	@gU.memo
-	def check_codon(start):
-		return len(gU.translate_mixed(arr[1, start * 3:][:3])) > 3
-
-	############
-
-	missing_nt = (arr[1] == 15).nonzero()[0]
-	missing_loci = [*filter(check_codon, np.unique(missing_nt // 3))]
-	arr[1, missing_nt] = arr[0, missing_nt]
-	missing = [*map(parse_missing, gU.groups(missing_loci))]
+	# Codons with an N, and > 3 possible amino acids (see cU.aa_counts)
+	n = arr.shape[1] // 3
+	has_N = (arr[1, :n * 3].reshape(n, 3) == 15).any(axis=1)
+	missing_loci = np.flatnonzero(has_N & (cU.count_aas(arr[1]) > 3))
+	arr[1] = np.where(arr[1] == 15, arr[0], arr[1])
+	missing = [*map(parse_missing, group_loci(missing_loci))]
 
 	return arr, missing
 
 #-------------------------------------------------------------------------------
-def get_indels(arr, c_arr, s_arr):
-	"Finds nt and (frame-aware) aa indels, pushing them to their furthest 3' loci."
+def get_indels(arr, c_arr, s_arr, ref):
+	"""
+	Finds nt and (frame-aware) aa indels, pushing them to their furthest 3'
+	loci - by the repeat run lengths of <ref> (deletions) or of the sample
+	(insertions, see <rU.repeat_runs>)
+	"""
 
-	def push_indel(loci, t_arr):
-		while op.eq(*t_arr[loci]):
-			loci += 1
-		return loci
+	def push_indel(loci, runs, n):
+		"Shifts <loci> 3' by the run at its start, without running off <n>"
+		return loci + min(runs[loci[0]], n - 1 - loci[1])
 
 	############
 
@@ -125,7 +288,7 @@ def get_indels(arr, c_arr, s_arr):
 
 		# Overwrite deleted position with reference base to allow <get_SNPs>
 		arr[1, slice(*loci)] = arr[0, slice(*loci)]
-		loci = push_indel(loci, arr[0])
+		loci = push_indel(loci, ref.runs(op.sub(*loci[::-1])), arr.shape[1])
 		pc = "c"
 
 		if (op.sub(*loci) % 3) == 0:
@@ -141,10 +304,11 @@ def get_indels(arr, c_arr, s_arr):
 
 		get_ins = lambda seq: "".join(map(str, seq))
 
-		loci = push_indel(loci, s_arr)
+		runs = rU.repeat_runs(s_arr, op.sub(*loci[::-1]))
+		loci = push_indel(loci, runs, len(s_arr))
 
 		fs = ((op.sub(*loci) % 3) == 0)
-		pc, func = (("c", gU.arr2seq), ("p", gU.translate_seq))[1 * fs]
+		pc, func = (("c", gU.arr2seq), ("p", cU.translate_letters))[1 * fs]
 		divisor = (2 * fs + 1)
 		loci -= (loci[0] % divisor)
 		locus = loci // divisor
@@ -155,23 +319,197 @@ def get_indels(arr, c_arr, s_arr):
 	############
 
 	indels = [
-		*map(parse_del, gU.groups((arr[1] == 0).nonzero()[0])),
-		*gU.chain(map(parse_ins, gU.groups((c_arr == 8).nonzero()[0])))
+		*map(parse_del, group_loci((arr[1] == 0).nonzero()[0])),
+		*gU.chain(map(parse_ins, group_loci((c_arr == 8).nonzero()[0])))
 	]
 
 	return arr, indels
 
 #-------------------------------------------------------------------------------
-def get_SNPs(arr):
-	"Returns non-wt amino acids at each variant locus - freq used for mixtures"
+def group_loci(loci):
+	"""
+	Returns the contiguous runs of sorted <loci> as [start, end) rows, as per
+	<gU.groups>
+	"""
+
+	if not len(loci := np.asarray(loci)): return np.empty((0, 2), dtype=int)
+
+	breaks = np.flatnonzero(np.diff(loci) != 1)
+	starts = loci[np.r_[0, breaks + 1]]
+	ends = loci[np.r_[breaks, len(loci) - 1]] + 1
+
+	return np.stack((starts, ends), axis=1)
 
-	SNPs = [
-		f"p.{list(ref)[0]}{locus}{aa}"
-		for locus, (ref, alt) in enumerate(zip(*map(gU.translate_seq, arr)), 1)
-		for aa in alt - ref
+#-------------------------------------------------------------------------------
+def get_SNPs(arr, ref):
+	"""
+	Returns non-wt amino acids at each variant locus - freq used for mixtures.
+	The sample is translated by codon lookup against the precomputed reference
+	translation (see cU and rU)
+	"""
+
+	return cU.call_SNPs(arr[1], ref.aa)
+
+################################################################################
+def iter_NGS(path):
+	"""
+	Yields the sample of QuasiBAM table <path> as (NAME, SEQ) - named by the
+	file, and without a sequence (see <import_NGS>) - if named with a MOLIS
+	number
+	"""
+
+	if re.match(MOLIS_regex, gU.MOLIS_name(name := gU.filestem(path), spaces=True)):
+		yield name, ""
+	else:
+		g2pU.log.warning(f"Skipping {path} - no MOLIS number in its name")
+
+#-------------------------------------------------------------------------------
+def import_NGS(df, min_freq=g2pU.ngs_min_freq):
+	"""
+	Calls the variants of the NGS samples of <df> (FASTAS, with the PATH of the
+	QuasiBAM table of each) straight from their base frequencies (see
+	<call_NGS>), without mapping, and appends them to VARIANTS in bulk
+	"""
+
+	if (new_df := df[~df.index.isin(g2pU.var.df.PARENT_ID)]).empty:
+		return g2pU.log.info("No new NGS analysis required")
+
+	g2pU.log.info(f"*-- Calling the variants of {len(new_df)} NGS sample(s) --*")
+	with g2pU.row_executor(init_worker) as run:
+		dfs = run(partial(call_NGS, min_freq=min_freq), new_df)
+
+	if dfs: g2pU.var.append(pd.concat(dfs))
+	g2pU.var.write()
+
+#-------------------------------------------------------------------------------
+def call_NGS(index, row, min_freq=g2pU.ngs_min_freq):
+	"""
+	Calls the variants of NGS sample <row> on each reference of its QuasiBAM
+	table (<row.PATH>, see <read_NGS>) with their frequencies (see <NGS_variants>)
+	"""
+
+	dfs = [
+		NGS_variants(rU.get(rname), counts, min_freq)
+		for rname, counts in read_NGS(row.PATH).items()
+	]
+	if not dfs: return pd.DataFrame(columns=["HGVS", "FREQ", "PARENT_ID"])
+
+	df = pd.concat(dfs, ignore_index=True)
+	df["PARENT_ID"] = index
+
+	return df
+
+#-------------------------------------------------------------------------------
+def read_NGS(path):
+	"""
+	Reads QuasiBAM table <path> (see <ngs_cols>) in chunks of up to
+	<ngs_chunksize> rows into the reads of each base and of deletions (A, C,
+	G, T and DEL) at each position of each reference, as an array per RNAME
+	(zero where not covered). Other references than those of rU are skipped.
+	"""
+
+	refs, counts, unknown = rU.references(), {}, set()
+	cols = [*ngs_cols.values()]
+
+	reader = pd.read_csv(
+		path, sep="\t", usecols=lambda col: col in ngs_cols,
+		dtype={"Reference": str}, chunksize=ngs_chunksize
+	)
+	for df in reader:
+		if len(missing := {*cols[:-1]} - {*df.rename(columns=ngs_cols).columns}):
+			g2pU.log.warning(f"Skipping {path} - no {', '.join(sorted(missing))} column(s)")
+			return {}
+
+		df = df.rename(columns=ngs_cols).reindex(columns=cols, fill_value=0)
+		for rname, df in df.groupby("RNAME"):
+			if (ref := refs.get(rname)) is None:
+				unknown.add(rname)
+				continue
+
+			arr = counts.setdefault(rname, np.zeros((len(ref), 5)))
+			df = df[df.POS.between(1, len(ref))]
+			arr[df.POS.astype(int) - 1] = df[cols[2:]].fillna(0).to_numpy()
+
+	if unknown: g2pU.log.warning(f"Skipping unknown reference(s) {', '.join(unknown)} in {path}")
+	return counts
+
+#-------------------------------------------------------------------------------
+def NGS_variants(ref, counts, min_freq):
+	"""
+	Calls the variants of the NGS reads <counts> (see <read_NGS>) on <ref> with
+	their frequencies (FREQ, %), from:
+	- the bases of at least <min_freq> % at each position, as a sequence of
+	  IUPAC codes (the reference base where none are, N where not covered) -
+	  each amino acid called taking its frequency from the codons that encode
+	  it (see cU.aa_freqs)
+	- each run of positions deleted in at least <min_freq> % of reads, from the
+	  reference with that run deleted - taking the lowest deletion frequency
+	  of the run
+	Missing loci have no frequency. Insertions cannot be called from base
+	frequencies.
+	"""
+
+	def call(seq, c_arr):
+		row = pd.Series({
+			"RNAME": ref.name, "POS": 1, "C_ARR": c_arr, "SEQ": seq,
+			"HSV": ref.hsv, "DOMAIN": ref.domain
+		})
+		return parse_variants(None, row).HGVS
+
+	############
+
+	depth = counts.sum(axis=1)
+	freqs = np.divide(counts, depth[:, None], out=np.zeros_like(counts), where=depth[:, None] > 0)
+	called = freqs >= min_freq / 100
+
+	masks = (called[:, :4] << np.arange(4)).sum(axis=1)
+	masks = np.where(masks == 0, ref.arr, masks)
+	masks[depth == 0] = 15
+
+	df = pd.DataFrame({"HGVS": call("".join(iupac[masks]), np.zeros(len(ref), dtype=np.int8))})
+
+	SNPs = df.HGVS.str.extract(r"\.p\.\D(\d+)(\D)$").dropna()
+	aa_freqs = cU.aa_freqs(freqs[:, :4])
+	df.loc[SNPs.index, "FREQ"] = 100 * aa_freqs[
+		SNPs[0].astype(int) - 1, SNPs[1].map(cU.AAS.index)
 	]
 
-	return SNPs
+	############
+
+	for start, end in group_loci(np.flatnonzero(called[:, 4])):
+		c_arr = np.zeros(len(ref), dtype=np.int8)
+		c_arr[start:end] = 1
+		deletions = call(ref.seq[:start] + ref.seq[end:], c_arr)
+		deletions = deletions[deletions.str.endswith("del")]
+		df = pd.concat((df, pd.DataFrame({
+			"HGVS": deletions, "FREQ": 100 * freqs[start:end, 4].min()
+		})))
+
+	return df.drop_duplicates("HGVS")
+
+################################################################################
+def verify(fas_df, var_df):
+	"""
+	Re-calls the variants of the sequences in <fas_df> and compares them with
+	those stored in <var_df> - a golden test of variant calling. Returns the
+	sequences whose variants differ, with the STORED and CALLED HGVS.
+	"""
+
+	def hgvs_sets(df):
+		return df.groupby("PARENT_ID").HGVS.agg(lambda ser: tuple(sorted(set(ser))))
+
+	with g2pU.row_executor(init_worker) as run:
+		called = [
+			df for chunk in map_fasta_seqs(fas_df) if not chunk.empty
+			for df in run(parse_variants, chunk)
+		]
+	called = pd.concat(called) if called else pd.DataFrame(columns=["HGVS", "PARENT_ID"])
+
+	stored = var_df[var_df.PARENT_ID.isin(fas_df.index)]
+	df = pd.concat(
+		(hgvs_sets(stored), hgvs_sets(called)), axis=1, keys=["STORED", "CALLED"]
+	)
+	return df[df.STORED != df.CALLED]
 
 ################################################################################
 def statistics():
@@ -0,0 +1,92 @@
+"""
+Shared fixtures. The tests import the modules under src/ as the commands do,
+and are skipped where these cannot be imported (e.g. without the Genomancer
+generalUtilities) or where the static references are missing.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+fixtures_dir = os.path.join(tests_dir, "data")
+sys.path.insert(0, os.path.abspath(os.path.join(tests_dir, os.pardir, "src")))
+
+################################################################################
+@pytest.fixture(scope="session")
+def utils():
+	"The utils package, or a skip if its dependencies are missing"
+
+	return pytest.importorskip("utils", exc_type=ImportError)
+
+#-------------------------------------------------------------------------------
+@pytest.fixture(scope="session")
+def refs(utils):
+	"The domain references (see rU), or a skip if ref_seqs.fas is missing"
+
+	if not os.path.exists(utils.rU.fname):
+		pytest.skip(f"{utils.rU.fname} not found")
+	return utils.rU.references()
+
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def tables(utils, tmp_path, monkeypatch):
+	"""
+	Points the DynamicTables at an empty data root under <tmp_path> (see
+	<set_dynamic_root>), with the variant cache disabled, and returns g2pT
+	"""
+
+	from data_init import g2pTables as g2pT
+
+	def unload():
+		for table in vars(g2pT).values():
+			if isinstance(table, g2pT.LazyTable):
+				object.__setattr__(table, "_table", None)
+
+	unload()
+	monkeypatch.setattr(g2pT.LazyTable, "loaded", [])
+	monkeypatch.setattr(g2pT, "dynamic_root", g2pT.dynamic_root)
+	monkeypatch.setattr(g2pT, "database", g2pT.database)
+	monkeypatch.setattr(utils.g2pU.g2pC.cache, "size", 0)
+	g2pT.set_dynamic_root(str(tmp_path))
+
+	yield g2pT
+	unload()
+
+#-------------------------------------------------------------------------------
+@pytest.fixture(scope="session")
+def dev_records(utils):
+	"""
+	The dev FASTA records mapped by BWA, with their variants (see
+	data/dev_variants.tsv) and sequences - as cleaned by sU.parse_FASTA
+	(<FASTA>), and as BWA reports them (<SEQ> - upper case, with any other
+	base than ACGT an N), indexed by QNAME
+	"""
+
+	df = pd.read_csv(f"{fixtures_dir}/dev_variants.tsv", sep="\t", keep_default_na=False)
+	root = f"{utils.g2pU.data_dir}/dev_data/FASTAs"
+
+	seqs = {
+		(fname, record): seq.replace("-", "")
+		for fname in df.FILE.unique()
+		for record, seq in enumerate(utils.gU.fas2df(f"{root}/{fname}").SEQ)
+	}
+	df["FASTA"] = [*map(seqs.get, zip(df.FILE, df.RECORD))]
+	df["SEQ"] = df.FASTA.str.upper().str.replace(r"[^ACGT]", "N", regex=True)
+	df["HGVS"] = df.HGVS.str.split().map(set)
+
+	return df.rename_axis("QNAME")
+
+#-------------------------------------------------------------------------------
+@pytest.fixture(scope="session")
+def dev_sam(utils, dev_records):
+	"The BWA records of <dev_records>, read as SAM (see sU.read_sam)"
+
+	df = dev_records
+	return utils.sU.read_sam([
+		"\t".join(map(str, (qname, 0, rname, pos, 60, cigar, "*", 0, 0, seq, "*")))
+		for qname, rname, pos, cigar, seq in
+		zip(df.index, df.RNAME, df.POS, df.CIGAR, df.SEQ)
+	])
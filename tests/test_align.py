@@ -0,0 +1,52 @@
+"""
+Tests of in-process alignment (aU) against the BWA mappings of the dev FASTAs
+(see data/dev_variants.tsv).
+"""
+
+import logging
+
+import pytest
+
+################################################################################
+def test_numpy_engine_matches_bwa(utils, refs, dev_records):
+	sU = utils.sU
+
+	sam = sU.read_sam([*sU.sam_lines(dev_records.assign(SEQ=dev_records.FASTA), "numpy")])
+	mapped = dev_records.loc[sam.index]
+	same = (sam.RNAME.astype(str) == mapped.RNAME) & (sam.POS == mapped.POS) \
+		   & (sam.CIGAR == mapped.CIGAR)
+
+	called = {index: {*sU.parse_variants(index, row).HGVS} for index, row in sam.iterrows()}
+	differ = [
+		index for index, expected in dev_records.HGVS.items()
+		if called.get(index, set()) != expected
+	]
+
+	# As measured: 3250 of 3269 mappings and all but 12 variant sets identical,
+	# the rest differing in the clipping of poor sequence, or in deletions
+	# longer than <aU.band>
+	assert same.sum() >= 0.99 * len(dev_records)
+	assert len(differ) <= 0.005 * len(dev_records), \
+		f"{len(differ)} records differ, e.g. {differ[:10]}"
+
+#-------------------------------------------------------------------------------
+def test_auto_engine_warns_without_bwa(utils, monkeypatch, caplog):
+	sU = utils.sU
+	monkeypatch.setattr(sU, "aligner", "auto")
+	monkeypatch.setattr(sU.shutil, "which", lambda cmd: None)
+
+	with caplog.at_level(logging.WARNING):
+		assert sU.choose_engine(1000) == "numpy"
+	assert "BWA not found" in caplog.text
+
+#-------------------------------------------------------------------------------
+@pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+def test_bwa_failure_is_logged(utils, dev_records, tmp_path, monkeypatch, caplog):
+	sU = utils.sU
+	if sU.shutil.which("bwa") is None: pytest.skip("bwa not found")
+
+	# No BWA index under this data directory
+	monkeypatch.setattr(sU.g2pU, "data_dir", str(tmp_path))
+	with caplog.at_level(logging.ERROR), pytest.raises(sU.sp.CalledProcessError):
+		[*sU.stream_bwa(dev_records.iloc[:5])]
+	assert "fail to locate the index" in caplog.text
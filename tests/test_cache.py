@@ -0,0 +1,71 @@
+"""
+Tests of the variant call cache (g2pCache).
+"""
+
+import pandas as pd
+import pytest
+
+################################################################################
+@pytest.fixture
+def g2pC(utils, tmp_path, monkeypatch):
+	"g2pCache, with a bundle of a single file under <tmp_path>"
+
+	from data_init import g2pCache as g2pC
+
+	(bundle := tmp_path / "bundle.fas").write_text(">ref\nACGT\n")
+	monkeypatch.setattr(g2pC, "bundle_files", [str(bundle)])
+	return g2pC
+
+#-------------------------------------------------------------------------------
+def calls(*seqs):
+	"VARIANTS rows of one variant per sequence of <seqs>, and their FASTAS rows"
+
+	df = pd.DataFrame({"SEQ": seqs})
+	return df, pd.DataFrame({"HGVS": [f"1.TK.p.A{i}T" for i in df.index], "PARENT_ID": df.index})
+
+#-------------------------------------------------------------------------------
+def test_calls_are_cached_by_engine(g2pC, tmp_path):
+	cache = g2pC.VariantCache(f"{tmp_path}/cache.sqlite", size=10)
+	df, var_df = calls("ACGT", "acg-t", "TTTT")
+	cache.store(df.iloc[[0, 2]], var_df.iloc[[0, 2]], "bwa")
+
+	cached, rest = cache.lookup(df, "bwa")
+	assert [*rest.index] == []
+	assert [*cached.HGVS] == ["1.TK.p.A0T", "1.TK.p.A0T", "1.TK.p.A2T"]
+
+	cached, rest = cache.lookup(df, "numpy")
+	assert cached.empty and len(rest) == 3
+
+#-------------------------------------------------------------------------------
+def test_missing_bundle_file_raises(g2pC, tmp_path, monkeypatch):
+	monkeypatch.setattr(g2pC, "bundle_files", [f"{tmp_path}/missing.fas"])
+
+	with pytest.raises(FileNotFoundError):
+		g2pC.VariantCache(f"{tmp_path}/cache.sqlite").open()
+
+#-------------------------------------------------------------------------------
+def test_lookups_are_flushed_and_least_used_evicted(g2pC, tmp_path):
+	cache = g2pC.VariantCache(f"{tmp_path}/cache.sqlite", size=3)
+	df, var_df = calls("AAAA", "CCCC", "GGGG", "TTTT")
+	cache.store(df.iloc[:3], var_df.iloc[:3], "bwa")
+
+	# Used, but only marked as such once flushed
+	used = lambda: dict(cache.database.conn.execute('SELECT KEY, USED FROM "CALLS"').fetchall())
+	before = used()
+	cache.lookup(df.iloc[[0, 2]], "bwa")
+	assert used() == before
+	cache.flush()
+	assert used() != before
+
+	cache.store(df.iloc[[3]], var_df.iloc[[3]], "bwa")
+	cached, rest = cache.lookup(df, "bwa")
+	assert [*rest.SEQ] == ["CCCC"]
+
+#-------------------------------------------------------------------------------
+def test_samples_without_sequence_are_not_cached(g2pC, tmp_path):
+	cache = g2pC.VariantCache(f"{tmp_path}/cache.sqlite", size=10)
+	df, var_df = calls("", "ACGT")
+	cache.store(df, var_df, "bwa")
+
+	cached, rest = cache.lookup(df, "bwa")
+	assert [*cached.HGVS] == ["1.TK.p.A1T"] and [*rest.SEQ] == [""]
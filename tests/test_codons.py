@@ -0,0 +1,31 @@
+"""
+Tests of codon translation by table lookup (cU) against the translation of
+generalUtilities, which it replaced.
+"""
+
+################################################################################
+def translated_SNPs(gU, arr):
+	"Substitutions as called before cU - by translating both rows of <arr>"
+
+	return [
+		f"p.{list(ref)[0]}{locus}{aa}"
+		for locus, (ref, alt) in enumerate(zip(*map(gU.translate_seq, arr)), 1)
+		for aa in alt - ref
+	]
+
+#-------------------------------------------------------------------------------
+def test_SNPs_match_translation(utils, refs, dev_sam, monkeypatch):
+	sU, gU = utils.sU, utils.gU
+	get_SNPs, differ = sU.get_SNPs, {}
+
+	def compare(arr, ref):
+		SNPs = get_SNPs(arr, ref)
+		if sorted(SNPs) != sorted(expected := translated_SNPs(gU, arr)):
+			differ[ref.name, len(differ)] = (expected, SNPs)
+		return SNPs
+
+	monkeypatch.setattr(sU, "get_SNPs", compare)
+	for index, row in dev_sam.iterrows():
+		sU.parse_variants(index, row)
+
+	assert not differ, f"{len(differ)} records differ, e.g. {[*differ.items()][:3]}"
@@ -0,0 +1,68 @@
+"""
+Tests of row-wise analysis in worker processes (g2pU.row_executor), in
+particular as the sequences are still being mapped by BWA.
+"""
+
+import os
+import select
+import shutil
+import threading
+
+import pandas as pd
+import pytest
+
+################################################################################
+def row_pid(index, row):
+	return pd.DataFrame({"PID": [os.getpid()]}, index=[index])
+
+#-------------------------------------------------------------------------------
+def test_workers_inherit_no_pipes(utils, monkeypatch):
+	"A pipe left open when the workers start closes with this process' end"
+
+	monkeypatch.setattr(utils.g2pU, "procs", 2)
+	read_end, write_end = os.pipe()
+
+	try:
+		with utils.g2pU.row_executor() as run:
+			df = pd.concat(run(row_pid, pd.DataFrame(index=range(4))))
+			os.close(write_end)
+			readable = select.select([read_end], [], [], 5)[0]
+	finally:
+		os.close(read_end)
+
+	assert os.getpid() not in df.PID.values
+	assert readable, "the workers hold the write end of the pipe"
+
+#-------------------------------------------------------------------------------
+def test_workers_while_streaming_bwa(utils, refs, dev_records, monkeypatch):
+	"""
+	Calls the dev FASTAs (four times over - with one thread, BWA maps batches
+	of 10 Mbp, reading one ahead) in worker processes as BWA maps them, so
+	that the workers start once the first of many <sU.chunksize> records
+	arrive, as BWA is still being fed - without deadlocking, and with the
+	golden variants
+	"""
+
+	if shutil.which("bwa") is None: pytest.skip("bwa not found")
+
+	sU, g2pU = utils.sU, utils.g2pU
+	df = pd.concat((dev_records, ) * 4, ignore_index=True).rename_axis("QNAME")
+	monkeypatch.setattr(sU, "chunksize", 100)
+	monkeypatch.setattr(sU, "aligner", "bwa")
+	monkeypatch.setattr(sU, "threads", 1)
+	monkeypatch.setattr(g2pU, "procs", 2)
+
+	result = []
+	verify = threading.Thread(
+		target=lambda: result.append(sU.verify(
+			df.assign(SEQ=df.FASTA), pd.DataFrame(columns=["HGVS", "PARENT_ID"])
+		)),
+		daemon=True
+	)
+	verify.start()
+	verify.join(timeout=600)
+
+	assert not verify.is_alive(), "variant calling deadlocked"
+	called = result[0].CALLED
+	assert len(called) == len(df)
+	assert all(set(hgvs) == df.HGVS[index] for index, hgvs in called.items())
@@ -0,0 +1,93 @@
+"""
+Tests of merging sharded imports (MERGE) into the main Tables.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+################################################################################
+def import_files(tables, files):
+	"""
+	Imports <files> - {FILENAME: {NAME: [HGVS, ...]}} - into FILES, FASTAS,
+	VARIANTS and MANIFEST <tables>, as SEQUENCES would
+	"""
+
+	fil, fas, var, man = tables
+	for fname, seqs in files.items():
+		_, df = fil.append(pd.DataFrame(
+			[["/runs", fname, pd.Timestamp("2024-01-01"), "RUN"]], columns=fil.cols
+		))
+		_, df = fas.append(pd.DataFrame(
+			{"NAME": [*seqs], "MOLIS": [*seqs], "SEQ": "ACGT", "PARENT_ID": df.index[0]}
+		))
+		var.append(pd.DataFrame(
+			[(hgvs, index) for index, name in zip(df.index, df.NAME) for hgvs in seqs[name]],
+			columns=["HGVS", "PARENT_ID"]
+		))
+		man.append(pd.DataFrame([[f"/runs/{fname}", 4, 0.0, fname]], columns=man.cols))
+
+	for table in tables: table.write()
+
+#-------------------------------------------------------------------------------
+def contents(tables):
+	"The variants of the main Tables, as {FILENAME: {NAME: {HGVS, ...}}}"
+
+	fil, fas, var = (table.df for table in (tables.fil, tables.fas, tables.var))
+	return {
+		fname: {
+			name: {*var.HGVS[var.PARENT_ID == fas_index].astype(str)}
+			for fas_index, name in fas.NAME[fas.PARENT_ID == index].items()
+		}
+		for index, fname in fil.FILENAME.astype(str).items()
+	}
+
+#-------------------------------------------------------------------------------
+def test_merge_shards_into_main_tables(utils, tables, tmp_path, monkeypatch):
+	MERGE = pytest.importorskip("MERGE", exc_type=ImportError)
+	g2pU = utils.g2pU
+	monkeypatch.setattr(MERGE, "log", g2pU.log, raising=False)
+	location = g2pU.ImportRun.location
+
+	main = [tables.fil, tables.fas, tables.var, tables.man]
+	import_files(main, {
+		"a.fas": {"H100000001": ["1.TK.p.A1T"]},
+		"b.fas": {"H100000002": ["1.TK.p.A2T"]}
+	})
+
+	# Shard 2 re-analyses b.fas, and left an import run unfinished
+	shards = [f"{tmp_path}/shards/{i}of2" for i in (1, 2)]
+	for root in shards: os.makedirs(f"{root}/dynamic")
+	import_files([table.at(shards[0]) for table in main], {
+		"c.fas": {"H100000003": ["1.TK.p.A3T", "1.TK.p.A4T"]}
+	})
+	import_files([table.at(shards[1]) for table in main], {
+		"b.fas": {"H100000004": ["1.TK.p.A5T"]},
+		"d.fas": {"H100000005": ["2.pol.None"], "H100000006": ["2.pol.p.A6T"]}
+	})
+	(mol := tables.mol.at(shards[1])).append(pd.DataFrame(
+		[["H100000004", True, False, False]], columns=mol.cols
+	))
+	mol.write()
+
+	run = g2pU.ImportRun(location=f"{shards[1]}/dynamic/runs")
+	run.log(["/runs/e.fas"], "FOUND")
+	run.commit()
+
+	assert MERGE.unfinished(shards[0]) == []
+	assert MERGE.unfinished(shards[1]) == ["/runs/e.fas"]
+	assert g2pU.ImportRun.location == location
+
+	for root in shards:
+		with tables.transaction():
+			MERGE.merge_shard(root)
+
+	assert contents(tables) == {
+		"a.fas": {"H100000001": {"1.TK.p.A1T"}},
+		"b.fas": {"H100000004": {"1.TK.p.A5T"}},
+		"c.fas": {"H100000003": {"1.TK.p.A3T", "1.TK.p.A4T"}},
+		"d.fas": {"H100000005": {"2.pol.None"}, "H100000006": {"2.pol.p.A6T"}}
+	}
+	assert sorted(tables.man.df.PATH) == [f"/runs/{f}.fas" for f in "abcd"]
+	assert [*tables.mol.df.MOLIS] == ["H100000004"]
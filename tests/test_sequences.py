@@ -0,0 +1,139 @@
+"""
+Tests of importing FASTAs (SEQUENCES) in bounded batches of records, and of
+importing NGS samples from QuasiBAM tables (--ngs).
+"""
+
+import os
+import shutil
+import sys
+
+import itertools as it
+import pandas as pd
+
+import pytest
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+################################################################################
+@pytest.fixture
+def sequences(utils, refs, tables, tmp_path, monkeypatch):
+	"""
+	Returns a function running SEQUENCES with command line <argv> over the
+	FASTAs of <tmp_path>/fas, and returning the records of each batch and the
+	FILES of each report
+	"""
+
+	SEQUENCES = pytest.importorskip("SEQUENCES", exc_type=ImportError)
+	sU, g2pU = utils.sU, utils.g2pU
+
+	for module, name in ((sU, "aligner"), (sU, "threads"), (g2pU, "procs")):
+		monkeypatch.setattr(module, name, getattr(module, name))
+	monkeypatch.setattr(SEQUENCES.rP, "format_code", None, raising=False)
+	monkeypatch.setattr(SEQUENCES, "log", g2pU.log, raising=False)
+	monkeypatch.setattr(g2pU.ImportRun, "location", f"{tmp_path}/runs")
+
+	batches, reports = [], []
+	import_batch = SEQUENCES.import_batch
+	def batch(records, *rest):
+		batches.append([*records.NAME])
+		return import_batch(records, *rest)
+	monkeypatch.setattr(SEQUENCES, "import_batch", batch)
+	monkeypatch.setattr(SEQUENCES, "report", lambda fil_df: reports.append(fil_df))
+
+	def run(*argv):
+		monkeypatch.setattr(sys, "argv", ["sequences", "-d", f"{tmp_path}/fas", *argv])
+		monkeypatch.setattr(SEQUENCES, "args", SEQUENCES.parse_arguments(), raising=False)
+		SEQUENCES.run(SEQUENCES.args)
+		return batches, reports
+
+	run.module = SEQUENCES
+	return run
+
+#-------------------------------------------------------------------------------
+def write_FASTAs(tmp_path, dev_records, sizes):
+	"""
+	Writes FASTAs of the first of <dev_records>, <sizes> records each, named by
+	MOLIS number - returning the variants of each, by NAME
+	"""
+
+	if shutil.which("bwa") is None: pytest.skip("bwa not found")
+	(root := tmp_path / "fas").mkdir()
+	records = dev_records.iloc[:sum(sizes)].assign(
+		NAME=[f"H{100000001 + i}" for i in range(sum(sizes))]
+	)
+
+	starts = [0, *it.accumulate(sizes)]
+	for i, (start, end) in enumerate(zip(starts, starts[1:])):
+		(root / f"240101_RUN{i}.fas").write_text("".join(
+			f">{name}\n{seq}\n" for name, seq in
+			zip(records.NAME.iloc[start:end], records.FASTA.iloc[start:end])
+		))
+
+	return dict(zip(records.NAME, records.HGVS))
+
+#-------------------------------------------------------------------------------
+def test_large_FASTA_spans_batches(sequences, tables, dev_records, tmp_path):
+	expected = write_FASTAs(tmp_path, dev_records, (7, 0, 2))
+	batches, reports = sequences("-i", "-r", "--batch", "3")
+
+	assert [*map(len, batches)] == [3, 3, 3, 0]
+	assert len(reports) == 1 and len(reports[0]) == 3
+
+	fas, var = tables.fas.df, tables.var.df
+	assert len(tables.fil.df) == 3 and len(fas) == 9
+	called = {
+		name: {*var.HGVS[var.PARENT_ID == index].astype(str)}
+		for index, name in fas.NAME.astype(str).items()
+	}
+	assert called == expected
+	assert len(tables.man.df) == 3
+
+#-------------------------------------------------------------------------------
+def test_report_only_removes_new_data(sequences, tables, dev_records, tmp_path):
+	write_FASTAs(tmp_path, dev_records, (4, 1))
+	batches, reports = sequences("-r", "--batch", "2")
+
+	assert [*map(len, batches)] == [2, 2, 1]
+	assert len(reports) == 1 and len(reports[0]) == 2
+	assert tables.fil.df.empty and tables.fas.df.empty and tables.var.df.empty
+
+#-------------------------------------------------------------------------------
+def test_import_NGS(sequences, tables, tmp_path, caplog):
+	"""
+	Imports a QuasiBAM table (data/H100000001_TK.tsv - HSV-1 TK at a depth of
+	1000, bar the first 9 bases, with A168T in 30% of reads, I100T in 0.5%, a
+	deletion of base 400 in 6% and of codon 201 in 12-14%), and one not named
+	with a MOLIS number
+	"""
+
+	(root := tmp_path / "fas").mkdir()
+	with open(f"{fixtures_dir}/H100000001_TK.tsv") as f: table = f.read()
+	(root / "H100000001_TK.tsv").write_text(table)
+	(root / "sample_TK.tsv").write_text(table)
+
+	batches, reports = sequences("--ngs", "-i", "--batch", "1")
+
+	assert batches == [["H100000001_TK"], []]
+	assert "sample_TK.tsv - no MOLIS number" in caplog.text
+
+	fas, var = tables.fas.df, tables.var.df
+	assert [*fas.MOLIS.astype(str)] == ["H100000001"] and [*fas.SEQ.astype(str)] == [""]
+	assert dict(zip(var.HGVS.astype(str), var.FREQ.fillna(-1))) == {
+		"1.TK.m.1_3": -1, "1.TK.p.A168T": 30.0, "1.TK.c.400del": 6.0, "1.TK.p.201del": 12.0
+	}
+	assert len(tables.fil.df) == 2 and len(tables.man.df) == 2
+
+	# NGS samples have no sequence to verify
+	assert sequences.module.verify() == 67
+
+#-------------------------------------------------------------------------------
+def test_NGS_bases_below_min_freq(utils, refs):
+	row = pd.Series({"PATH": f"{fixtures_dir}/H100000001_TK.tsv"})
+
+	def called(min_freq):
+		df = utils.sU.call_NGS(0, row, min_freq)
+		return dict(zip(df.HGVS, df.FREQ))
+
+	assert "1.TK.p.I100T" not in called(1.0)
+	assert called(0.4)["1.TK.p.I100T"] == pytest.approx(0.5)
+	assert [*called(10)] == ["1.TK.m.1_3", "1.TK.p.A168T", "1.TK.p.201del"]
@@ -0,0 +1,45 @@
+"""
+Tests of the Tables (g2pTables) and their storage (g2pStorage).
+"""
+
+import numpy as np
+import pandas as pd
+
+################################################################################
+def test_filter_column_with_missing_values(tables, tmp_path):
+	table = tables.DynamicTable("FASTAS", cols=["NAME", "MOLIS"], root=str(tmp_path))
+	table.df = pd.DataFrame({
+		"NAME": ["a", "b", "c", "d"], "MOLIS": ["H100000001", np.nan, "H100000002", "H100000001"]
+	})
+
+	assert table.filter(("MOLIS", ["H100000001"]), index=True) == [0, 3]
+	assert table.filter(("MOLIS", ["H100000002"]), index=True) == [2]
+
+#-------------------------------------------------------------------------------
+def test_journal_keeps_empty_strings(tables, tmp_path):
+	"Rows read back through the journal match those of the compacted Table"
+
+	cols = ["NAME", "MOLIS", "FREQ", "PARENT_ID"]
+	table = lambda: tables.DynamicTable(
+		"FASTAS", cols=cols, key=["NAME", "MOLIS"], categories=["MOLIS"],
+		root=str(tmp_path)
+	)
+
+	(fas := table()).append(pd.DataFrame([["a", "H100000001", 1.5, 0]], columns=cols))
+	fas.write()
+	fas.append(pd.DataFrame([["b", "", np.nan, 0]], columns=cols))
+	fas.write()
+	assert len(fas.journal)
+
+	journaled = table()
+	journaled.compact()
+	compacted = table()
+
+	pd.testing.assert_frame_equal(journaled.df, compacted.df)
+	assert [*journaled.df.MOLIS] == ["H100000001", ""]
+	assert np.isnan(journaled.df.FREQ[1])
+
+	# Natural keys and filters see the empty string as such
+	index, _ = journaled.append(pd.DataFrame([["b", "", np.nan, 0]], columns=cols))
+	assert not len(index)
+	assert journaled.filter(("MOLIS", [""]), index=True) == [1]
@@ -0,0 +1,54 @@
+"""
+Golden tests of variant calling (sU.parse_variants) over the dev FASTAs.
+
+data/dev_variants.tsv holds, for each dev FASTA record (FILE, RECORD), its
+BWA mapping (RNAME, POS, CIGAR) and the HGVS set called from it by the calling
+code before indel normalisation was vectorised (i.e. by the original loop of
+<push_indel>). The records are re-called from the stored mappings, and their
+sequences as BWA reports them (see <dev_records>), so that BWA is not needed.
+"""
+
+import pytest
+
+################################################################################
+def test_dev_variants_match_golden(utils, refs, dev_records, dev_sam):
+	called = {
+		index: {*utils.sU.parse_variants(index, row).HGVS}
+		for index, row in dev_sam.iterrows()
+	}
+
+	differ = {
+		index: (expected, called[index])
+		for index, expected in dev_records.HGVS.items()
+		if called[index] != expected
+	}
+	assert len(called) == len(dev_records)
+	assert not differ, f"{len(differ)} records differ, e.g. {[*differ.items()][:3]}"
+
+#-------------------------------------------------------------------------------
+def test_verify_without_sequences_fails(utils, tables, monkeypatch):
+	SEQUENCES = pytest.importorskip("SEQUENCES", exc_type=ImportError)
+	monkeypatch.setattr(SEQUENCES, "log", utils.g2pU.log, raising=False)
+
+	assert tables.fas.df.empty
+	assert SEQUENCES.verify() == 67
+
+#-------------------------------------------------------------------------------
+def test_analyse_data_appends_each_chunk(utils, refs, dev_records, tables, monkeypatch):
+	sU, g2pU = utils.sU, utils.g2pU
+	monkeypatch.setattr(sU, "chunksize", 10)
+	monkeypatch.setattr(sU, "aligner", "numpy")
+
+	df = dev_records.iloc[:25]
+	fas_df = tables.fas.append(df.assign(NAME=df.index.astype(str), PARENT_ID=0))[1]
+	appended = []
+	monkeypatch.setattr(
+		tables.var.load(), "append",
+		lambda df, append=tables.var.append, **kwargs: appended.append(len(df)) or append(df, **kwargs)
+	)
+
+	var_df = g2pU.analyse_data(fas_df, tables.var, sU.parse_variants, "variant", sU.init_worker)
+
+	assert len(appended) == 3 and sum(appended) == len(var_df)
+	called = [{*ser} for _, ser in var_df.groupby("PARENT_ID").HGVS]
+	assert called == [*df.HGVS]